@@ -0,0 +1,76 @@
+"""
+Record ``python -X importtime`` for each entry point of bw_visualization.
+
+Every entry point is imported in a fresh interpreter. The script prints the cumulative import time of each entry
+point and its slowest imported modules, and writes the raw ``-X importtime`` logs to ``--output`` if given.
+
+Usage::
+
+    python benchmarks/importtime.py [--top 5] [--output importtime.log]
+"""
+import argparse
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "import bw_visualization",
+    "from bw_visualization.sankertainpy import recursive_calculation_to_plotly",
+    "from bw_visualization.sankertainpy import plot",
+    "from bw_visualization.sankertainpy import generate_sankey",
+    "from bw_visualization.compare_plot import lca_graphic",
+    "from bw_visualization.compare_plot.utils import lca_comparison",
+    "from bw_visualization.database_explorer.utils import calculate_traversal",
+    "from bw_visualization.database_explorer import ListAct",
+]
+
+
+def importtime(statement):
+    """
+    Import a statement in a fresh interpreter with ``-X importtime``.
+
+    Parameters
+    ----------
+    statement : str
+        Import statement to run.
+
+    Returns
+    -------
+    tuple
+        Raw log and list of ``(cumulative microseconds, module, nesting level)`` of all imported modules.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level
+        level = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(cumulative), name.strip(), level))
+    return result.stderr, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest modules to list per entry point.")
+    parser.add_argument("--output", help="File to write the raw importtime logs to.")
+    args = parser.parse_args()
+
+    logs = []
+    for statement in ENTRY_POINTS:
+        log, modules = importtime(statement)
+        logs.append(f"# {statement}\n{log}")
+        total = sum(cumulative for cumulative, _, level in modules if level == 0)
+        print(f"{total / 1e3:10.1f} ms  {statement}")
+        for cumulative, name, _ in sorted(modules, reverse=True)[:args.top]:
+            print(f"{cumulative / 1e3:20.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(logs))
+
+
+if __name__ == "__main__":
+    main()
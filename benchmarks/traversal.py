@@ -0,0 +1,145 @@
+"""
+Time the JRC graph traversal of the database explorer with and without the reuse of one technosphere factorization.
+
+``calculate`` is timed three ways on the same LCA:
+
+- ``spsolve``: every cumulative score is solved from scratch with ``bw2calc.spsolve``, as before the factorization
+  was reused (the scores are still computed once per activity);
+- ``factorized``: the default, every cumulative score is solved against one factorization of the technosphere matrix;
+- ``adjoint``: all the unit cumulative scores are computed up front with one transposed solve.
+
+The LCA is either a synthetic system of ``--size`` activities, or an activity of the USEEIO test fixture when the
+path of ``useeio.tar.gz`` (see ``tests/conftest.py``) is given with ``--useeio``. The fixture is restored in a
+temporary directory.
+
+Usage::
+
+    python benchmarks/traversal.py [--size 400] [--cutoff 0.005] [--repeat 3]
+    python benchmarks/traversal.py --useeio tests/fixtures/useeio.tar.gz
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+USEEIO_PROJECT_NAME = 'USEEIO-1.1-noproducts'
+USEEIO_ACTIVITY = "Metal windows, doors, and architectural products; at manufacturer"
+
+
+def synthetic_lca(size, inputs=4, flows=5, seed=42):
+    """
+    LCA of a random supply chain of ``size`` activities, each consuming ``inputs`` other activities.
+
+    The inputs of an activity sum up to less than one unit, so that the technosphere matrix is invertible. Each
+    activity emits every one of ``flows`` flows, characterized with factors of both signs.
+    """
+    import bw2calc as bc
+    import bw_processing as bwp
+
+    rng = np.random.default_rng(seed)
+    production = [(i, i) for i in range(size)]
+    consumption = [(int(j), i) for i in range(size) for j in rng.choice(size - 1, inputs, replace=False) + 1 if j != i]
+    technosphere = np.array(production + consumption, dtype=bwp.INDICES_DTYPE)
+    amounts = np.concatenate([np.ones(size), rng.uniform(0.01, 0.9 / inputs, len(consumption))])
+    flip = np.concatenate([np.zeros(size, dtype=bool), np.ones(len(consumption), dtype=bool)])
+    biosphere = np.array([(size + k, i) for i in range(size) for k in range(flows)], dtype=bwp.INDICES_DTYPE)
+    characterization = np.array([(size + k, size + k) for k in range(flows)], dtype=bwp.INDICES_DTYPE)
+
+    dp = bwp.create_datapackage()
+    dp.add_persistent_vector(matrix="technosphere_matrix", indices_array=technosphere, data_array=amounts,
+                             flip_array=flip)
+    dp.add_persistent_vector(matrix="biosphere_matrix", indices_array=biosphere,
+                             data_array=rng.uniform(0.1, 2, len(biosphere)))
+    dp.add_persistent_vector(matrix="characterization_matrix", indices_array=characterization,
+                             data_array=rng.uniform(-0.5, 1, flows))
+    lca = bc.LCA({0: 1}, data_objs=[dp])
+    lca.lci()
+    lca.lcia()
+    return lca
+
+
+def useeio_lca(fixture, base_dir):
+    """LCA of one product of the USEEIO fixture, restored in ``base_dir``, for the first of its methods."""
+    import bw2calc as bc
+    import bw2data as bd
+    import bw2io as bi
+
+    bd.projects.change_base_directories(Path(base_dir), project_name="benchmark", update=False)
+    bi.restore_project_directory(fixture)
+    bd.projects.set_current(USEEIO_PROJECT_NAME)
+    lca = bc.LCA({bd.get_node(name=USEEIO_ACTIVITY): 1}, list(bd.methods)[0])
+    lca.lci()
+    lca.lcia()
+    return lca
+
+
+def spsolve_traversal():
+    """Traversal solving every cumulative score from scratch, without the shared factorization."""
+    from bw_visualization.database_explorer.utils import JRCAssumedDiagonalGraphTraversal
+
+    class SpsolveTraversal(JRCAssumedDiagonalGraphTraversal):
+        def cumulative_score(self, index, supply, characterized_biosphere, characterized_biosphere_neg,
+                             characterized_biosphere_pos, lca, solver=None, unit_scores=None):
+            return super().cumulative_score(index, supply, characterized_biosphere, characterized_biosphere_neg,
+                                            characterized_biosphere_pos, lca, None, unit_scores)
+
+        def cumulative_scores(self, indices, supply, characterized_biosphere, characterized_biosphere_neg,
+                              characterized_biosphere_pos, lca, solver=None, unit_scores=None, diagonal=None):
+            return super().cumulative_scores(indices, supply, characterized_biosphere, characterized_biosphere_neg,
+                                             characterized_biosphere_pos, lca, None, unit_scores, diagonal)
+
+    return SpsolveTraversal()
+
+
+def best_time(function, repeat):
+    """Best wall time of ``repeat`` calls of ``function``, and its last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=400, help="Number of activities of the synthetic system.")
+    parser.add_argument("--useeio", help="Path of the USEEIO fixture archive, instead of the synthetic system.")
+    parser.add_argument("--cutoff", type=float, default=0.005, help="Cutoff of the traversal.")
+    parser.add_argument("--max-calc", type=float, default=1e5, help="Maximum number of calculations.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each variant, the best is kept.")
+    args = parser.parse_args()
+
+    from bw_visualization.database_explorer.utils import JRCAssumedDiagonalGraphTraversal
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        if args.useeio:
+            lca = useeio_lca(args.useeio, base_dir)
+            print(f"USEEIO: {USEEIO_ACTIVITY}, {lca.technosphere_matrix.shape[0]} activities")
+        else:
+            lca = synthetic_lca(args.size)
+            print(f"Synthetic system: {args.size} activities")
+
+        variants = {
+            "spsolve": lambda: spsolve_traversal().calculate(lca, cutoff=args.cutoff, max_calc=args.max_calc),
+            "factorized": lambda: JRCAssumedDiagonalGraphTraversal().calculate(
+                lca, cutoff=args.cutoff, max_calc=args.max_calc),
+            "adjoint": lambda: JRCAssumedDiagonalGraphTraversal().calculate(
+                lca, cutoff=args.cutoff, max_calc=args.max_calc, adjoint=True),
+        }
+        results = {}
+        for name, function in variants.items():
+            seconds, results[name] = best_time(function, args.repeat)
+            print(f"{name:>12}: {seconds:8.3f} s  {len(results[name]['edges']['path_id'])} edges")
+
+        reference = results["spsolve"]["edges"]["impact"]
+        for name in ("factorized", "adjoint"):
+            impact = results[name]["edges"]["impact"]
+            same = impact.shape == reference.shape and np.allclose(impact, reference)
+            print(f"{name:>12}: {'same' if same else 'DIFFERENT'} edge impacts as spsolve")
+
+
+if __name__ == "__main__":
+    main()
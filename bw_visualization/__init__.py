@@ -1,5 +1,5 @@
 """bw_visualization."""
-from bw_visualization.utils import get_version_tuple
+from bw_visualization.utils import get_version_tuple, lazy_getattr
 
 __all__ = (
     "__version__",
@@ -9,3 +9,10 @@ __all__ = (
 )
 
 __version__ = get_version_tuple()
+
+# the subpackages and their plotting dependencies are only imported on first access
+__getattr__ = lazy_getattr(__name__, {
+    "compare_plot": (".compare_plot", None),
+    "database_explorer": (".database_explorer", None),
+    "sankertainpy": (".sankertainpy", None),
+})
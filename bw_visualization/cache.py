@@ -0,0 +1,140 @@
+"""Persistent cache of supply chain traversals, stored in the directory of the current Brightway project.
+
+Results are stored as compressed ``.npz`` files: numeric tables as arrays, everything else as a JSON document.
+The key of a result covers the demand, the method, the traversal parameters and the modification timestamps of all
+databases of the project, so writing to any database invalidates the cached results automatically.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import bw2data as bd
+
+from bw_visualization.utils import get_version_tuple
+
+CACHE_DIRNAME = "bw_visualization_cache"
+
+
+def activity_id(activity):
+    """
+    Return the database id of an activity given as proxy, id or ``(database, code)`` tuple.
+
+    Parameters
+    ----------
+    activity : Activity, int or tuple
+        Activity to identify.
+
+    Returns
+    -------
+    int
+        Database id of the activity.
+    """
+    if isinstance(activity, (int, np.integer)):
+        return int(activity)
+    if isinstance(activity, tuple):
+        return bd.get_activity(activity).id
+    return activity.id
+
+
+def traversal_key(kind, demand, method, **parameters):
+    """
+    Build the cache key of a traversal.
+
+    Parameters
+    ----------
+    kind : str
+        Name of the calculation producing the result, e.g. ``"jrc"``.
+    demand : dict
+        Functional unit as ``{activity: amount}``.
+    method : tuple
+        Impact assessment method.
+    **parameters
+        Further parameters of the calculation, e.g. ``cutoff`` and ``max_calc``.
+
+    Returns
+    -------
+    str
+        Hexadecimal sha256 digest identifying the result.
+    """
+    content = {
+        "version": get_version_tuple(),
+        "kind": kind,
+        "demand": sorted((activity_id(act), float(amount)) for act, amount in demand.items()),
+        "method": list(method),
+        "parameters": parameters,
+        "databases": sorted((name, bd.databases[name].get("modified")) for name in bd.databases),
+    }
+    method_fp = bd.Method(method).filepath_processed()
+    content["method_modified"] = os.path.getmtime(method_fp) if os.path.exists(method_fp) else None
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_filepath(key):
+    """
+    Return the path of the cache file of a key in the current project.
+
+    Parameters
+    ----------
+    key : str
+        Key returned by ``traversal_key``.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the ``.npz`` file.
+    """
+    return bd.projects.request_directory(CACHE_DIRNAME) / f"{key}.npz"
+
+
+def load_traversal(key):
+    """
+    Load a cached result.
+
+    Parameters
+    ----------
+    key : str
+        Key returned by ``traversal_key``.
+
+    Returns
+    -------
+    tuple or None
+        ``(arrays, metadata)`` as stored by ``save_traversal``, or None if nothing is cached under this key.
+    """
+    fp = cache_filepath(key)
+    if not fp.exists():
+        return None
+    try:
+        with np.load(fp, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files if name != "metadata"}
+            metadata = json.loads(str(data["metadata"]))
+    except (OSError, ValueError, KeyError):
+        # unreadable file, e.g. from an interrupted write: treat as a cache miss
+        return None
+    return arrays, metadata
+
+
+def save_traversal(key, arrays, metadata):
+    """
+    Store a result in the cache.
+
+    Parameters
+    ----------
+    key : str
+        Key returned by ``traversal_key``.
+    arrays : dict
+        Numeric or string arrays to store, by name.
+    metadata : dict
+        JSON serializable data to store.
+    """
+    fp = cache_filepath(key)
+    tmp = fp.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(tmp, fp)
+
+
+def clear_cache():
+    """Remove all cached results of the current project."""
+    shutil.rmtree(bd.projects.request_directory(CACHE_DIRNAME))
@@ -1,6 +1,16 @@
-from . import utils
-from .compare_plot import lca_graphic, impact_transfer, hotspots, compare
+from bw_visualization.utils import lazy_getattr
 
-plot = lca_graphic
+# exports are imported on first access, so that importing the package does not load seaborn and ipywidgets
+__getattr__ = lazy_getattr(__name__, {
+    'utils': ('.utils', None),
+    'plot': ('.compare_plot', 'lca_graphic'),
+    'lca_graphic': ('.compare_plot', 'lca_graphic'),
+    'impact_transfer': ('.compare_plot', 'impact_transfer'),
+    'hotspots': ('.compare_plot', 'hotspots'),
+    'compare': ('.compare_plot', 'compare'),
+    'ResultStore': ('.utils', 'ResultStore'),
+    'Report': ('.report', 'Report'),
+    'lca_report': ('.compare_plot', 'lca_report'),
+})
 
-__all__ = ['plot', 'utils', 'impact_transfer', 'hotspots', 'compare']
+__all__ = ['plot', 'utils', 'impact_transfer', 'hotspots', 'compare', 'ResultStore', 'Report', 'lca_report']
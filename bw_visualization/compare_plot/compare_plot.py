@@ -5,27 +5,38 @@ from typing import List
 import pandas as pd
 import numpy as np
 import bw2data as bd
-import matplotlib.pyplot as plt
-import ipywidgets as widgets
-import seaborn as sns
-from IPython.display import display
 
-from .utils import lca_comparison, contributions_df, act_topscore
+from bw_visualization.utils import lazy_import
+from .report import Report
+from .utils import lca_comparison, contributions_df, contributions_dfs, act_topscore, ResultStore, activity_names
+
+plt = lazy_import("matplotlib.pyplot")
+sns = lazy_import("seaborn")
 
 # define standard color palette:
 COLORS = ["#F08C2E", "#7f6000", "#72AF42", "#A32683"]
 COLORS.extend(COLORS)
 
-# create longer color list for complex figures
-ColorDivYlBr = sns.color_palette('YlOrBr', 6)
-ColorSeqGreen = sns.color_palette('Greens', 6)
-ColorSeqRdPu = sns.color_palette('RdPu', 6)
-ColorSeqOrg = sns.color_palette('Oranges', 5)
+# create longer color list for complex figures, computed on first access
+PALETTES = {
+    'ColorDivYlBr': ('YlOrBr', 6),
+    'ColorSeqGreen': ('Greens', 6),
+    'ColorSeqRdPu': ('RdPu', 6),
+    'ColorSeqOrg': ('Oranges', 5),
+}
+
+
+def __getattr__(name):
+    if name not in PALETTES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    palette = sns.color_palette(*PALETTES[name])
+    globals()[name] = palette
+    return palette
 
 
 # the 2 following methods come directly from the library lca_algebraic from stats.py :
 # https://github.com/oie-mines-paristech/lca_algebraic/blob/master/lca_algebraic/stats.py
-def _display_tabs(titles_and_contentf: List[tuple]):
+def _display_tabs(titles_and_contentf: List[tuple], report=None, level=3):
     """
     Generate tabs
 
@@ -33,12 +44,26 @@ def _display_tabs(titles_and_contentf: List[tuple]):
     ----------
     titles_and_contentf : list
         A list of tuples each containing title and callable visualization.
+    report : Report, optional
+        Report to write the tabs to, one section after the other, instead of displaying them (None by default).
+    level : int, optional
+        Heading level of the sections in the report (3 by default).
 
     Returns
     -------
     None
         This function does not return any value.
     """
+    if report is not None:
+        # each visualization is only called once the previous one is written
+        for title, content_f in titles_and_contentf:
+            report.section(title, level=level)
+            content_f()
+        return
+
+    from IPython.display import display
+    import ipywidgets as widgets
+
     tabs = []
     titles = []
     for title, content_f in titles_and_contentf:
@@ -69,6 +94,8 @@ def display_with_export_button(df):
     None
         This function does not return any value.
     """
+    from IPython.display import display
+    import ipywidgets as widgets
 
     button = widgets.Button(description="Export data")
     button.style.button_color = "lightgray"
@@ -86,7 +113,23 @@ def display_with_export_button(df):
     display(widgets.VBox([button, dfout]))
 
 
-def graph_method_ref(df, reference_category=None, sharex=True, func_unit="kg"):
+def _show(fig, report=None):
+    """Display a figure, or write it to the report and close it."""
+    if report is None:
+        plt.show()
+    else:
+        report.figure(fig)
+
+
+def _show_table(df, report=None):
+    """Display a DataFrame with the option to export it, or write it to the report."""
+    if report is None:
+        display_with_export_button(df)
+    else:
+        report.table(df)
+
+
+def graph_method_ref(df, reference_category=None, sharex=True, func_unit="kg", report=None):
     """
     Compare LCAs on provided reference category
 
@@ -100,6 +143,8 @@ def graph_method_ref(df, reference_category=None, sharex=True, func_unit="kg"):
         Shared X axes ? True by default.
     func_unit : str, optional
         Functional unit (kg by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -161,10 +206,10 @@ def graph_method_ref(df, reference_category=None, sharex=True, func_unit="kg"):
         # add a subtitle
         axes.set_title("for 1 " + func_unit, fontsize=17, ha='center', y=1.1, color='gray')
         plt.tight_layout()
-        plt.show(fig)
+        _show(fig, report)
 
 
-def graph_multi(df, methods, sharex=True, cols=2, func_unit="kg"):
+def graph_multi(df, methods, sharex=True, cols=2, func_unit="kg", report=None):
     """
     Compare LCAs on several impact categories
 
@@ -180,6 +225,8 @@ def graph_multi(df, methods, sharex=True, cols=2, func_unit="kg"):
         Number of columns to plot.
     func_unit : str, optional
         Functional unit (kg by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -242,12 +289,12 @@ def graph_multi(df, methods, sharex=True, cols=2, func_unit="kg"):
                      ha='center', y=1.03)  # centered title in bold
         fig.text(0.5, 0.99, "for 1 " + func_unit, fontsize=17, ha='center', color='gray')
         plt.tight_layout()
-        plt.show(fig)
+        _show(fig, report)
 
-        display_with_export_button(df)
+        _show_table(df, report)
 
 
-def compare(df, methods, reference_category=None, sharex=True, cols=2, func_unit="kg"):
+def compare(df, methods, reference_category=None, sharex=True, cols=2, func_unit="kg", report=None):
     """
     Compare several activities for several impact categories
 
@@ -265,6 +312,8 @@ def compare(df, methods, reference_category=None, sharex=True, cols=2, func_unit
         The number of columns to plot.
     func_unit : str, optional
         Functional unit (kg by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -277,25 +326,27 @@ def compare(df, methods, reference_category=None, sharex=True, cols=2, func_unit
         reference_category = methods[0]
 
     def compare_graph_method_ref():
-        graph_method_ref(df, reference_category, sharex, func_unit)
+        graph_method_ref(df, reference_category, sharex, func_unit, report=report)
 
     def compare_graph_multi():
-        graph_multi(df, methods, sharex, cols, func_unit)
+        graph_multi(df, methods, sharex, cols, func_unit, report=report)
 
+    if report is not None:
+        report.section("Comparison")
     _display_tabs([
         ("Reference indicator", compare_graph_method_ref),
         ("All indicators", compare_graph_multi),
-    ])
+    ], report=report)
 
 
-def contributions(df_contrib, act, method, df, df_color, reference_category):
+def contributions(df_contrib, act, method, df, df_color, reference_category, report=None):
     """
     Compare several activities for several impact categories
 
     Parameters
     ----------
     df_contrib : pd.DataFrame
-        Dataframe with the main contributors of the lca score.
+        Dataframe with the main contributors of the lca score, indexed by activity id (see ``contributions_dfs``).
     act : dict
         Activity to be analyzed.
     methods : list
@@ -306,6 +357,8 @@ def contributions(df_contrib, act, method, df, df_color, reference_category):
         Dataframe to colorize each method.
     reference_category : tuple
         The method used for normalization (None by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -316,9 +369,8 @@ def contributions(df_contrib, act, method, df, df_color, reference_category):
         warnings.simplefilter("ignore")
 
         # Instead of keys we prefer using  activity names
-        names = []
-        for c in df_contrib.index:
-            names.append(bd.get_activity(c)['name'])
+        names_by_id = activity_names(df_contrib.index)
+        names = [names_by_id[c] for c in df_contrib.index]
 
         # Add a row for the other contributors
         df_contrib.loc['Others'] = [df[method][act['name']] - df_contrib[c].sum() for c in df_contrib.columns]
@@ -329,7 +381,7 @@ def contributions(df_contrib, act, method, df, df_color, reference_category):
         fig, axes = plt.subplots(figsize=(20, 10))
         sns.set_style("white")
         plt.subplots_adjust(None, None, None, None, 0.5, 0.5)
-        plt.barh(df_contrib.index, df_contrib[method], alpha=0.8, color=df_color[method])
+        plt.barh(range(len(df_contrib)), df_contrib[method], alpha=0.8, color=df_color[method])
         axes.set_title(f'Contribution analysis of LCA on {method[1]}', fontsize=20)
         axes.set_xlabel(bd.Method(method).name[1], fontsize=20)
         axes.set_xticks([])
@@ -374,11 +426,11 @@ def contributions(df_contrib, act, method, df, df_color, reference_category):
         fig.suptitle("Contribution analysis of " + act['name'] + "\n", fontsize=30, fontweight='bold', ha='center',
                      x=axes.get_position().x0 + 0.5, y=1.02)  # centered title in bold
         plt.tight_layout()
-        plt.show()
-        display_with_export_button(df_contrib)
+        _show(fig, report)
+        _show_table(df_contrib, report)
 
 
-def hotspots(df, fu, methods, reference_category=None, limit=0.05):
+def hotspots(df, fu, methods, reference_category=None, limit=0.05, store=None, n_jobs=1, report=None):
     """
     Plot the contribution analysis of an activity for several impact categories and display the associated DataFrame
     ready to export. If the number of activities is too large, the figure is not displayed.
@@ -395,6 +447,13 @@ def hotspots(df, fu, methods, reference_category=None, limit=0.05):
         Method used for normalization (None by default).
     limit: float
         Relative threshold of the total lca score from which contributors are displayed (0.05 by default).
+    store : ResultStore, optional
+        Store of LCA results shared with the other helpers (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -402,23 +461,33 @@ def hotspots(df, fu, methods, reference_category=None, limit=0.05):
         This function does not return any value.
     """
     df = df.copy(deep=True)
+    if store is None:
+        store = ResultStore()
 
     if reference_category is None:  # if no reference method is given, the first method is chosen by default.
         reference_category = methods[0]
 
+    if report is not None:
+        report.section("Hotspots")
+
     # to have one color by method, we define a dataframe:
     df_color = pd.DataFrame(index=methods, data=[COLORS[c] for c in range(len(methods))]).T
 
     if len(fu) > 7:
         print('The number of activities is too large to plot the contributions for each of them')
     else:
+        store.fetch(fu, methods, n_jobs=n_jobs)
         for act in list(fu.keys()):
+            contributions_by_category = contributions_dfs(act, methods, limit=limit, store=store, index='id')
+            if report is not None:
+                report.section(act['name'], level=3)
             _display_tabs([("on " + str(i[1]),
-                            contributions(contributions_df(act, i, limit=limit),
-                                          act, i, df, df_color, reference_category)) for i in methods])
+                            lambda m=i: contributions(contributions_by_category[m], act, m, df, df_color,
+                                                      reference_category, report=report))
+                           for i in methods], report=report, level=4)
 
 
-def heatmap(df_norm, methods, func_unit):
+def heatmap(df_norm, methods, func_unit, report=None):
     """
     Plot the heatmap for comparison of different LCAs and display the associated DataFrame
     ready to export.
@@ -431,6 +500,8 @@ def heatmap(df_norm, methods, func_unit):
         Set of impact category methods.
     func_unit : str, optional
         Functional unit (kg by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -450,11 +521,11 @@ def heatmap(df_norm, methods, func_unit):
         fig.suptitle("Comparison of different LCA", fontsize=20, fontweight='bold', x=0.44,
                      y=1.02)  # centered title in bold
         axes.set_title("for 1 " + func_unit, fontsize=17, ha='center', y=1.1, color='gray')
-        plt.show()
-        display_with_export_button(df_norm)
+        _show(fig, report)
+        _show_table(df_norm, report)
 
 
-def transfer_impact(fu, act_ref, df_norm, methods):
+def transfer_impact(fu, act_ref, df_norm, methods, report=None):
     """Plot impact transfer
 
     Parameters
@@ -467,6 +538,8 @@ def transfer_impact(fu, act_ref, df_norm, methods):
         Impact score DataFrame with normalized results for each impact category.
     methods : list
         Set of impact category methods.
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -524,28 +597,35 @@ def transfer_impact(fu, act_ref, df_norm, methods):
                 size=20,
             )
         axes.set_yticks([0])  # to remove all the graduations and keep only the zero
-        plt.show()
+        _show(fig, report)
 
 
-def reference_contributions(df, act, methods, cols):
+def reference_contributions(df, act, methods, cols, store=None, report=None):
     """Analyze contributions for the reference impact category
 
     Parameters
     ----------
     df : pd.DataFrame
-        DataFrame with the impact score for each categories and each activities.
+        DataFrame with the top contributors for the reference impact category, indexed by activity id (see
+        ``contributions_df``).
     act : dict
         Activity to be analyzed.
     methods : list
         Set of impact category methods.
     cols: int
         Number of columns to plot.
+    store : ResultStore, optional
+        Store of LCA results shared with the other helpers (a new one by default).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
     None
         This function does not return any value.
     """
+    if store is None:
+        store = ResultStore()
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
 
@@ -553,10 +633,8 @@ def reference_contributions(df, act, methods, cols):
         top_contributors_reference = list(df.index)
 
         # Compute the contributors for the other impact categories and gather it into a dictionnary
-        contributions_by_category = {}
-        for m in methods:
-            # very small threshold to get almost every contributors
-            contributions_by_category[m] = contributions_df(act, m, limit=0.000001, norm=True)
+        # very small threshold to get almost every contributors
+        contributions_by_category = contributions_dfs(act, methods, limit=0.000001, norm=True, store=store, index='id')
 
         # Create an empty dataframe with the top reference contributors as indexes and the impact categories as
         # columns
@@ -567,13 +645,12 @@ def reference_contributions(df, act, methods, cols):
         for c in top_contributors_reference:
             for m in methods:
                 if c in contributions_by_category[m].index:
-                    result_df.at[c, m] = contributions_by_category[m].loc[c][0]
+                    result_df.at[c, m] = contributions_by_category[m].loc[c].iloc[0]
                 else:
                     result_df.at[c, m] = np.nan
 
-        names = []
-        for c in result_df.index:
-            names.append(bd.get_activity(c)['name'])
+        names_by_id = activity_names(result_df.index)
+        names = [names_by_id[c] for c in result_df.index]
 
         # Add a row for the other contributors
         result_df.loc['Others'] = [100 - result_df[c].sum() for c in result_df.columns]
@@ -588,7 +665,7 @@ def reference_contributions(df, act, methods, cols):
 
             sns.set_style("white")
             plt.subplots_adjust(None, None, None, None, 0.5, 0.5)
-            axes = result_df.plot(
+            axes = result_df[methods].astype(float).plot(
                 ax=axes, sharey=True, subplots=True,
                 layout=(nb_rows, cols),
                 legend=None,
@@ -626,10 +703,11 @@ def reference_contributions(df, act, methods, cols):
             fig.suptitle("Contribution analysis of " + act['name'] + "\n", fontsize=30, fontweight='bold',
                          ha='center', y=1.02)  # centered title in bold
             plt.tight_layout()
-            plt.show()
+            _show(fig, report)
 
 
-def impact_transfer(df, fu, methods, reference_category=None, limit=5, cols=3, func_unit="kg"):
+def impact_transfer(df, fu, methods, reference_category=None, limit=5, cols=3, func_unit="kg", store=None,
+                    n_jobs=1, report=None):
     """
     Plot the variations of the contribution of the top processes (for the reference method) for each impact category
 
@@ -649,6 +727,13 @@ def impact_transfer(df, fu, methods, reference_category=None, limit=5, cols=3, f
         Number of columns to plot
     func_unit : str, optional
         Functional unit (kg by default).
+    store : ResultStore, optional
+        Store of LCA results shared with the other helpers (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
+    report : Report, optional
+        Report to write the figures to, instead of displaying them (None by default).
 
     Returns
     -------
@@ -656,34 +741,40 @@ def impact_transfer(df, fu, methods, reference_category=None, limit=5, cols=3, f
         This function does not return any value.
     """
     df = df.copy(deep=True)
+    if store is None:
+        store = ResultStore()
 
     if reference_category is None:  # if no reference method is given, the first method is chosen by default.
         reference_category = methods[0]
-    act_ref = act_topscore(fu, reference_category)
+    # the contributions of all the methods are plotted for each activity
+    store.fetch(fu, methods, n_jobs=n_jobs)
+    act_ref = act_topscore(fu, reference_category, store=store)
     df_norm = df.T.apply(lambda x: x / x.max(), axis=1)  # to normalize the results for each impact category
 
     def impact_transfer_heatmap():
-        heatmap(df_norm, methods, func_unit)
+        heatmap(df_norm, methods, func_unit, report=report)
 
     def impact_transfer_transfer_impact():
-        transfer_impact(fu, act_ref, df_norm, methods)
+        transfer_impact(fu, act_ref, df_norm, methods, report=report)
 
     def impact_transfer_reference_contributions(act):
         df = contributions_df(act, reference_category, limit=limit, limit_type='number',
-                              group_by_other=False, norm=True)
-        reference_contributions(df, act, methods, cols)
+                              group_by_other=False, norm=True, store=store, index='id')
+        reference_contributions(df, act, methods, cols, store=store, report=report)
 
+    if report is not None:
+        report.section("Impact transfer")
     if len(fu) == 2:
         _display_tabs([("Impact transfer", impact_transfer_transfer_impact), ("Heatmap", impact_transfer_heatmap)] +
-                      [(j['name'], lambda x=j: impact_transfer_reference_contributions(x)) for j in list(fu.keys())]
-                      )
+                      [(j['name'], lambda x=j: impact_transfer_reference_contributions(x)) for j in list(fu.keys())],
+                      report=report)
     else:
         _display_tabs([("Heatmap", impact_transfer_heatmap)] +
-                      [(j['name'], lambda x=j: impact_transfer_reference_contributions(x)) for j in list(fu.keys())]
-                      )
+                      [(j['name'], lambda x=j: impact_transfer_reference_contributions(x)) for j in list(fu.keys())],
+                      report=report)
 
 
-def lca_graphic(fu, methods, reference_category=None, func_unit="kg"):
+def lca_graphic(fu, methods, reference_category=None, func_unit="kg", store=None, n_jobs=1, report=None):
     """
     Generic function that calls the other methods to plot:
 
@@ -702,18 +793,68 @@ def lca_graphic(fu, methods, reference_category=None, func_unit="kg"):
         Method used for normalization (None by default).
     func_unit : str, optional
         Functional unit (kg by default).
+    store : ResultStore, optional
+        Store of LCA results shared by all the plots, so that each result is calculated once (a new one by
+        default). Its ``solves`` and ``saved`` attributes report the solves done and saved.
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default). Activities of
+        unrelated databases are then solved with separate factorizations, in parallel (see ``ResultStore.fetch``).
+    report : Report, optional
+        Report to write all the figures to, one after the other, instead of displaying the dashboards (None by
+        default). See also ``lca_report``.
 
     Returns
     -------
     None
         This function does not return any value.
     """
+    if store is None:
+        store = ResultStore()
 
     if reference_category is None:  # if no reference method is given, the first method is chosen by default.
         reference_category = methods[0]
 
-    df = lca_comparison(fu, methods, method_ref=reference_category)
+    df = lca_comparison(fu, methods, method_ref=reference_category, store=store, n_jobs=n_jobs)
 
-    compare(df, methods, func_unit=func_unit)
-    impact_transfer(df, fu, methods, reference_category=reference_category, limit=5, func_unit=func_unit, cols=2)
-    hotspots(df, fu, methods, limit=0.02)
+    compare(df, methods, func_unit=func_unit, report=report)
+    impact_transfer(df, fu, methods, reference_category=reference_category, limit=5, func_unit=func_unit, cols=2,
+                    store=store, report=report)
+    hotspots(df, fu, methods, limit=0.02, store=store, report=report)
+
+
+def lca_report(path, fu, methods, reference_category=None, func_unit="kg", store=None, n_jobs=1, title=None):
+    """
+    Write the figures of ``lca_graphic`` to a PDF or HTML file, without a notebook.
+
+    The figures are drawn with the Agg backend and written one at a time (see ``Report``), so that reports can be
+    generated in batch, e.g. one per product family.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        File to write, with a ``.pdf`` or ``.html`` extension.
+    fu : dict
+        Dictionary of the activity/activities to compare associated with its/their associated reference flow(s).
+    methods : list
+        Set of methods.
+    reference_category : tuple, optional
+        Method used for normalization (None by default).
+    func_unit : str, optional
+        Functional unit (kg by default).
+    store : ResultStore, optional
+        Store of LCA results shared by all the plots (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
+    title : str, optional
+        Title of the report (the name of the file by default).
+
+    Returns
+    -------
+    Report
+        The written report.
+    """
+    with Report(path, title=title) as report:
+        lca_graphic(fu, methods, reference_category=reference_category, func_unit=func_unit, store=store,
+                    n_jobs=n_jobs, report=report)
+    return report
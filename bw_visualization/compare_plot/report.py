@@ -0,0 +1,132 @@
+import base64
+import html
+import io
+from pathlib import Path
+
+from bw_visualization.utils import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+backend_pdf = lazy_import("matplotlib.backends.backend_pdf")
+
+HTML_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>img {{max-width: 100%;}} table {{border-collapse: collapse;}} td, th {{padding: 2px 8px;}}</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+HTML_FOOTER = """</body>
+</html>
+"""
+
+
+class Report:
+    """
+    Headless output of the compare_plot figures, written to one PDF or HTML file.
+
+    The figures are drawn with the Agg backend, without IPython nor ipywidgets, and each one is written to the file
+    and closed as soon as it is complete, so that the memory used does not grow with the number of figures. The tabs
+    of the notebook dashboards are written one after the other, as sections. HTML reports contain the section headings,
+    the figures and the tables; PDF reports contain one page per figure.
+
+    Use it as a context manager and pass it as ``report`` to the plotting functions, or use ``lca_report``::
+
+        with Report("comparison.pdf") as report:
+            lca_graphic(fu, methods, report=report)
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        File to write, with a ``.pdf`` or ``.html`` extension.
+    title : str, optional
+        Title of the report (the name of the file by default).
+    dpi : int, optional
+        Resolution of the figures of HTML reports (100 by default).
+
+    Attributes
+    ----------
+    figures : int
+        Number of figures written.
+    """
+
+    def __init__(self, path, title=None, dpi=100):
+        self.path = Path(path)
+        self.format = self.path.suffix.lower().lstrip('.')
+        if self.format not in ('pdf', 'html'):
+            raise ValueError(f"Unsupported report file '{self.path.name}', the extension must be '.pdf' or '.html'")
+        self.title = title if title is not None else self.path.stem
+        self.dpi = dpi
+        self.figures = 0
+        self._file = None
+        self._backend = None
+
+    def __repr__(self):
+        return f"Report('{self.path}', {self.figures} figures)"
+
+    def __enter__(self):
+        # switching the backend closes the open figures, the ones of the report are closed once written anyway
+        self._backend = plt.get_backend()
+        plt.switch_backend("Agg")
+        if self.format == 'pdf':
+            self._file = backend_pdf.PdfPages(self.path, metadata={'Title': self.title})
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(HTML_HEADER.format(title=html.escape(self.title)))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.format == 'html':
+            self._file.write(HTML_FOOTER)
+        self._file.close()
+        self._file = None
+        plt.switch_backend(self._backend)
+
+    def section(self, title, level=2):
+        """
+        Start a section of the report.
+
+        Parameters
+        ----------
+        title : str
+            Title of the section.
+        level : int, optional
+            Heading level of the title (2 by default).
+        """
+        if self.format == 'html':
+            self._file.write(f"<h{level}>{html.escape(title)}</h{level}>\n")
+
+    def figure(self, fig):
+        """
+        Write a figure to the report and close it.
+
+        Parameters
+        ----------
+        fig : matplotlib.figure.Figure
+            Figure to write.
+        """
+        if self.format == 'pdf':
+            self._file.savefig(fig, bbox_inches="tight")
+        else:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=self.dpi, bbox_inches="tight")
+            image = base64.b64encode(buffer.getvalue()).decode('ascii')
+            self._file.write(f'<img src="data:image/png;base64,{image}">\n')
+        plt.close(fig)
+        self.figures += 1
+
+    def table(self, df):
+        """
+        Write a DataFrame to the report, for HTML reports only.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            DataFrame to write.
+        """
+        if self.format == 'html':
+            self._file.write(df.to_html(float_format=lambda x: f"{x:.4g}"))
+            self._file.write("\n")
@@ -1,10 +1,290 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import bw2calc as bc
+import bw2data as bd
 import numpy as np
 import pandas as pd
-import bw2analyzer as ba
+from bw2data.backends import ActivityDataset
+
+from bw_visualization.utils import activate_project, project_location
+
+
+class ResultStore:
+    """
+    Results of the LCA calculations of compare_plot, shared by its helpers.
+
+    Results are keyed by ``(activity, amount, method)``. They are computed from the supply of each activity per
+    unit of product, solved once with one factorization of the technosphere matrix for all the activities requested
+    together, and from the characterized biosphere matrix of each method, computed once. Pass the same store to
+    several helpers, or to several ``lca_graphic`` calls, to reuse the results.
+
+    Activities which should not share one factorization, e.g. of unrelated databases, can instead be solved in
+    worker processes with ``fetch``.
+
+    Attributes
+    ----------
+    solves : int
+        Number of supplies solved.
+    requests : int
+        Number of results requested.
+    """
+
+    def __init__(self):
+        self._lca = None
+        self._lca_ids = None
+        self._supply = {}
+        self._characterized_biosphere = {}
+        self._results = {}
+        self._activity_ids = {}
+        self.solves = 0
+        self.requests = 0
+
+    @property
+    def saved(self):
+        """Number of solves saved, compared to one LCA per requested result."""
+        return max(self.requests - self.solves, 0)
+
+    def __repr__(self):
+        return f"ResultStore({len(self._results)} results, {self.solves} solves, {self.saved} solves saved)"
+
+    def _unsolved(self, activities, methods):
+        """Activities missing a result per unit of product for one of the methods."""
+        return [act for act in activities if any((act.id, 1, m) not in self._results for m in methods)]
+
+    def _add(self, activity_id, activity_ids, units):
+        """Add results per unit of product of an activity, as ``{method: contributions}`` over ``activity_ids``."""
+        if self._activity_ids.get(activity_id) is not activity_ids:
+            # the results of an activity share the activity columns of the matrices they were computed with
+            self._results = {key: value for key, value in self._results.items() if key[0] != activity_id}
+            self._activity_ids[activity_id] = activity_ids
+        self._results.update(((activity_id, 1, method), value) for method, value in units.items())
+
+    def _solve(self, activities, method):
+        """Solve the supply per unit of product of the activities not solved yet, as the columns of one block."""
+        missing = [act for act in activities if act.id not in self._supply]
+        if not missing:
+            return
+        if self._lca is None or any(act.id not in self._lca.dicts.product for act in missing):
+            # new matrices covering all the activities, the results computed with the old ones are dropped
+            demand = {act_id: 1 for act_id in self._supply}
+            demand.update((act.id, 1) for act in missing)
+            self._lca = bc.LCA(demand, method)
+            self._lca.load_lci_data()
+            self._results = {
+                key: value for key, value in self._results.items()
+                if self._activity_ids[key[0]] is not self._lca_ids
+            }
+            self._activity_ids = {
+                act_id: ids for act_id, ids in self._activity_ids.items() if ids is not self._lca_ids
+            }
+            reversed_ids = self._lca.dicts.activity.reversed
+            self._lca_ids = np.array([reversed_ids[column] for column in range(len(reversed_ids))])
+            self._supply, self._characterized_biosphere = {}, {}
+
+        missing = list({act.id: act for act in missing}.values())
+        demands = np.zeros((self._lca.technosphere_matrix.shape[0], len(missing)))
+        for column, act in enumerate(missing):
+            demands[self._lca.dicts.product[act.id], column] = 1
+        supply = bc.spsolve(self._lca.technosphere_matrix, demands).reshape(demands.shape)
+        for column, act in enumerate(missing):
+            self._supply[act.id] = supply[:, column]
+        self.solves += len(missing)
+
+    def _method(self, method):
+        """Characterization factors of a method times the biosphere matrix, as a vector of activity columns."""
+        if method not in self._characterized_biosphere:
+            self._lca.switch_method(method)
+            self._characterized_biosphere[method] = (
+                self._lca.characterization_matrix.diagonal() @ self._lca.biosphere_matrix
+            )
+        return self._characterized_biosphere[method]
+
+    def _unit(self, activity, method):
+        """Direct contributions of every activity to the score of one unit of product of an activity."""
+        key = (activity.id, 1, method)
+        if key not in self._results:
+            self._solve([activity], method)
+            self._add(activity.id, self._lca_ids, {method: self._method(method) * self._supply[activity.id]})
+        return self._results[key]
+
+    def fetch(self, activities, methods, n_jobs=1):
+        """
+        Compute the missing results of several activities in worker processes.
+
+        The activities are grouped by database, and each group is one task for the pool: the activities of one
+        database are solved together with one factorization of their own matrices, in the worker. The results are
+        then read from the store like the ones computed in this process.
+
+        Parameters
+        ----------
+        activities : iterable
+            Activities to assess.
+        methods : list
+            Impact category methods.
+        n_jobs : int, optional
+            Number of worker processes (1 by default). With 1, or if the activities to solve are all of the same
+            database, nothing is done here and the results are computed in this process when requested.
+        """
+        if n_jobs < 1:
+            raise ValueError("n_jobs must be a positive integer")
+        groups = {}
+        for act in self._unsolved(activities, methods):
+            groups.setdefault(act['database'], {})[act.id] = act
+        if n_jobs == 1 or len(groups) < 2:
+            return
+
+        # spawn, so that the workers do not share the SQLite connection of the parent process
+        with ProcessPoolExecutor(
+                min(n_jobs, len(groups)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(project_location(),),
+        ) as executor:
+            futures = [executor.submit(unit_contribution_matrices, list(group), methods) for group in groups.values()]
+            for future in futures:
+                for activity_id, (activity_ids, contributions) in future.result().items():
+                    self._add(activity_id, activity_ids, dict(zip(methods, contributions)))
+                    self.solves += 1
+
+    def contributions(self, activity, amount, method):
+        """
+        Direct contributions of every activity to the score of an activity.
+
+        Parameters
+        ----------
+        activity : Activity
+            Activity to assess.
+        amount : float
+            Amount of the activity.
+        method : tuple
+            Impact category method.
+
+        Returns
+        -------
+        np.ndarray
+            Contribution of each activity of ``activity_ids(activity)``, summing up to the score.
+        """
+        self.requests += 1
+        key = (activity.id, amount, method)
+        if key not in self._results:
+            unit = self._unit(activity, method)
+            self._results[key] = unit if amount == 1 else amount * unit
+        return self._results[key]
+
+    def contribution_matrix(self, activity, amount, methods):
+        """
+        Direct contributions of every activity to the scores of an activity for several methods.
+
+        Parameters
+        ----------
+        activity : Activity
+            Activity to assess.
+        amount : float
+            Amount of the activity.
+        methods : list
+            Impact category methods.
+
+        Returns
+        -------
+        np.ndarray
+            Contributions, of shape ``(len(activity_ids(activity)), len(methods))``, the column of each method summing
+            up to its score.
+        """
+        if self._unsolved([activity], methods):
+            # all the methods with the same matrices, for the contributions of the same activities
+            self._solve([activity], methods[0])
+            self._add(activity.id, self._lca_ids, {m: self._method(m) * self._supply[activity.id] for m in methods})
+        return np.column_stack([self.contributions(activity, amount, m) for m in methods])
+
+    def scores(self, fu, methods, n_jobs=1):
+        """
+        Scores of several activities for several methods.
+
+        Parameters
+        ----------
+        fu : dict
+            Dictionary of the activity/activities to compare associated with its/their associated reference flow/s.
+        methods : list
+            Impact category methods.
+        n_jobs : int, optional
+            Number of worker processes solving the activities of different databases (1 by default, see ``fetch``).
 
+        Returns
+        -------
+        np.ndarray
+            Scores, of shape ``(len(fu), len(methods))``.
+        """
+        self.fetch(fu, methods, n_jobs=n_jobs)
+        self._solve(self._unsolved(fu, methods), methods[0])
+        return np.array([[self.contributions(act, q, m).sum() for m in methods] for act, q in fu.items()])
 
-def lca_comparison(fu, methods, method_ref=None):
+    def activity_ids(self, activity):
+        """Database ids of the activities of the entries of the ``contributions`` of an activity."""
+        return self._activity_ids[activity.id]
+
+
+def init_worker(location):
+    """Activate the project of the parent process, given by ``project_location``, in a worker of ``fetch``."""
+    activate_project(*location)
+
+
+def unit_contribution_matrices(activity_ids, methods):
+    """
+    Compute the direct contributions to the scores of one unit of product of several activities, in a worker.
+
+    Parameters
+    ----------
+    activity_ids : list
+        Database ids of the activities, solved together.
+    methods : list
+        Impact category methods.
+
+    Returns
+    -------
+    dict
+        Dictionary from activity id to a tuple of the database ids of the contributing activities and of the list of
+        their contributions for each method.
+    """
+    store = ResultStore()
+    activities = [bd.get_activity(activity_id) for activity_id in activity_ids]
+    store.scores({act: 1 for act in activities}, methods)
+    return {
+        act.id: (store.activity_ids(act), [store.contributions(act, 1, m) for m in methods]) for act in activities
+    }
+
+
+def lca_scores(fu, methods, store=None, n_jobs=1):
+    """
+    Compute the scores of several activities for several impact categories with one LCA.
+
+    The matrices are built once for all activities and the technosphere matrix is factorized once: the demands of
+    all activities are solved together as the columns of one right-hand side, and the inventories are characterized
+    by the characterization factors of each method (see ``ResultStore``).
+
+    Parameters
+    ----------
+    fu : dict
+        Dictionary of the activity/activities to compare associated with its/their associated reference flow/s.
+    methods : list
+        Impact category methods.
+    store : ResultStore, optional
+        Store of results to read and update (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
+
+    Returns
+    -------
+    np.ndarray
+        Scores, of shape ``(len(fu), len(methods))``.
+    """
+    if store is None:
+        store = ResultStore()
+    return store.scores(fu, methods, n_jobs=n_jobs)
+
+
+def lca_comparison(fu, methods, method_ref=None, store=None, n_jobs=1):
     """
     Compare several activities for several impact categories and return a DataFrame with the impact score for each
     categories and each activities.
@@ -17,6 +297,11 @@ def lca_comparison(fu, methods, method_ref=None):
         Set of methods.
     method_ref : tuple
         Method used for normalization (by default, None).
+    store : ResultStore, optional
+        Store of results to read and update (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
 
     Returns
     -------
@@ -26,32 +311,13 @@ def lca_comparison(fu, methods, method_ref=None):
     if method_ref is None:  # if no reference method is given, the first method is chosen by default.
         method_ref = methods[0]
 
-    scores = []
-    names = []
-    if len(methods) > 1:  # for multi impact categories
-        for act, q in zip(fu.keys(), fu.values()):
-            lca = bc.LCA({act: q}, methods[0])
-            lca.lci()
-            lca.lcia()
-            res = []
-            for m in methods:
-                lca.switch_method(m)
-                lca.lcia()
-                res.append(lca.score)
-            scores.append(res)
-            names.append(act['name'])
-    else:
-        for act, q in zip(fu.keys(), fu.values()):
-            lca = bc.LCA({act: q}, methods[0])
-            lca.lci()
-            lca.lcia()
-            scores.append(lca.score)
-            names.append(act['name'])
+    scores = lca_scores(fu, methods, store=store, n_jobs=n_jobs)
+    names = [act['name'] for act in fu]
 
     return pd.DataFrame(index=names, data=scores, columns=methods).sort_values(by=[method_ref], ascending=False)
 
 
-def act_topscore(fu, method_ref):
+def act_topscore(fu, method_ref, store=None, n_jobs=1):
     """
     Give the activity which has the highest score the reference method
 
@@ -61,6 +327,11 @@ def act_topscore(fu, method_ref):
         Dictionary of the activity/activities to compare associated with its/their associated reference flow/s.
     method_ref : tuple
         Method used for normalization.
+    store : ResultStore, optional
+        Store of results to read and update (a new one by default).
+    n_jobs : int, optional
+        Number of worker processes solving the activities of different databases (1 by default, see
+        ``ResultStore.fetch``).
 
     Returns
     -------
@@ -68,28 +339,108 @@ def act_topscore(fu, method_ref):
         Highest score activity.
     """
     activities = list(fu.keys())
-    scores = []
-
-    for act, q in zip(activities, fu.values()):
-        lca = bc.LCA({act: q}, method_ref)
-        lca.lci()
-        lca.lcia()
-        scores.append(lca.score)
+    scores = lca_scores(fu, [method_ref], store=store, n_jobs=n_jobs)[:, 0].tolist()
 
     max_index = scores.index(max(scores))
 
     return activities[max_index]
 
 
-def contributions_df(activity, method, limit=0.01, limit_type='percent', group_by_other=False, norm=False):
-    """Gather in a dataframe the main contributors of the lca score
+def top_contributors(contributions, limit=0.01, limit_type='percent'):
+    """
+    Select the top contributors of each column of a contribution matrix.
+
+    Like ``bw2analyzer.ContributionAnalysis.sort_array``, applied to all the columns at once: only the candidates
+    picked by ``np.argpartition`` are sorted, instead of every activity of the matrices.
+
+    Parameters
+    ----------
+    contributions : np.ndarray
+        Contributions, of shape ``(number of activities, number of methods)``.
+    limit : float, optional
+        Relative threshold of the sum of the absolute contributions (0.01 by default), or number of contributors.
+    limit_type : str, optional
+        'percent' or 'number' ('percent' by default).
+
+    Returns
+    -------
+    list
+        For each column, the rows of its top contributors by decreasing absolute contribution.
+    """
+    if limit_type not in ('number', 'percent'):
+        raise ValueError("limit_type must be either 'percent' or 'number'.")
+    # one contiguous row per method
+    magnitudes = np.ascontiguousarray(np.abs(contributions).T)
+    if limit_type == 'percent':
+        if not 0 < limit <= 1:
+            raise ValueError("Percentage limits > 0 and <= 1.")
+        counts = (magnitudes >= magnitudes.sum(axis=1, keepdims=True) * limit).sum(axis=1)
+    else:
+        counts = np.full(magnitudes.shape[0], min(int(limit), magnitudes.shape[1]))
+
+    k = int(counts.max(initial=0))
+    if k == 0:
+        candidates = np.zeros((magnitudes.shape[0], 0), dtype=int)
+    elif k < magnitudes.shape[1]:
+        candidates = np.sort(np.argpartition(-magnitudes, k - 1, axis=1)[:, :k], axis=1)
+    else:
+        candidates = np.broadcast_to(np.arange(magnitudes.shape[1]), magnitudes.shape)
+    # decreasing magnitude, the stable sort of the candidates by row keeps equal contributions in row order
+    order = np.argsort(-np.take_along_axis(magnitudes, candidates, axis=1), axis=1, kind='stable')
+    ranked = np.take_along_axis(candidates, order, axis=1)
+    return [rows[:count] for rows, count in zip(ranked, counts)]
+
+
+def activities_metadata(ids, chunk_size=500):
+    """
+    Fetch the name, location and code of several activities at once.
+
+    Instead of one ``bd.get_activity`` query per activity, the ids are looked up with ``IN (...)`` queries of at most
+    ``chunk_size`` ids, to stay below the SQLite limit of query variables.
+
+    Returns
+    -------
+    dict
+        Dictionary from activity id to a dictionary with the ``name``, ``location`` and ``code`` fields.
+    """
+    ids = list(set(ids))
+    metadata = {}
+    for start in range(0, len(ids), chunk_size):
+        query = ActivityDataset.select().where(ActivityDataset.id.in_(ids[start:start + chunk_size]))
+        for row in query:
+            metadata[row.id] = {"name": row.name, "location": row.location, "code": row.code}
+    return metadata
+
+
+def activity_names(ids, chunk_size=500):
+    """
+    Fetch the names of several activities from their ids at once.
+
+    The ids, e.g. of ``ResultStore.activity_ids`` or the index of ``contributions_dfs(..., index='id')``, are looked up
+    with ``IN (...)`` queries of at most ``chunk_size`` ids, like ``activities_metadata``. Unlike the codes, they are
+    unique across databases.
+
+    Returns
+    -------
+    dict
+        Dictionary from activity id to activity name.
+    """
+    return {activity_id: row['name'] for activity_id, row in activities_metadata(ids, chunk_size=chunk_size).items()}
+
+
+def contributions_dfs(activity, methods, limit=0.01, limit_type='percent', group_by_other=False, norm=False,
+                      store=None, index='code'):
+    """Gather in a dataframe per impact category the main contributors of the lca score
+
+    The contributions of all the impact categories are computed as one matrix, and the activities selected for any
+    of them are looked up in the database once.
 
     Parameters
     ----------
     activity : dict
         Activity to be analyzed.
-    method : tuple
-        Impact category method.
+    methods : list
+        Impact category methods.
     limit: float, optional
         Relative threshold of the total lca score from which contributors are displayed : (0.01 by default).
     limit_type : str, optional
@@ -98,32 +449,75 @@ def contributions_df(activity, method, limit=0.01, limit_type='percent', group_b
         Group the other contributors into an 'other' category (True by default).
     norm : bool, optional
         Norm the contributions (False by default).
+    store : ResultStore, optional
+        Store of results to read and update (a new one by default).
+    index : str, optional
+        Field of the contributors used as index, 'code' or 'id' ('code' by default). The codes are only unique within
+        a database, use the ids to look the contributors up again, e.g. with ``activity_names``.
 
     Returns
     -------
-    pd.DataFrame
-        main contributors to the lca score.
+    dict
+        Dictionary from impact category method to the dataframe of its main contributors (see ``contributions_df``).
     """
+    if index not in ('code', 'id'):
+        raise ValueError(f"Unsupported index '{index}', it must be 'code' or 'id'")
+    if store is None:
+        store = ResultStore()
+    contributions = store.contribution_matrix(activity, 1, methods)
+    totals = contributions.sum(axis=0)
+    top = top_contributors(contributions, limit=limit, limit_type=limit_type)
+    ids = store.activity_ids(activity)
+    if index == 'code':
+        metadata = activities_metadata(ids[np.concatenate(top)].tolist())
 
-    ca = ba.ContributionAnalysis()
-    # we compute the top contributors for the impact category
-    lca = bc.LCA({activity: 1}, method)
-    lca.lci()
-    lca.lcia()
-    # returns a list of tuples: (lca score, supply amount, activity name)
-    contrib = (ca.annotated_top_processes(lca, limit=limit, limit_type=limit_type))
+    dfs = {}
+    for column, (method, rows) in enumerate(zip(methods, top)):
+        labels = ids[rows].tolist()
+        if index == 'code':
+            labels = [metadata[activity_id]['code'] for activity_id in labels]
+        scores = contributions[rows, column].tolist()
 
-    names = [i[2]['name'] + ' [' + i[2]['location'] + ']' for i in
-             contrib]  # for each impact category we concatenate all names
-    codes = [i[2]['code'] for i in contrib]
-    scores = [i[0] for i in contrib]  # for each impact category we add a new tuple for the scores
+        if group_by_other:
+            labels.append('Others')
+            scores.append(totals[column] - np.sum(scores))
 
-    if group_by_other:
-        names.append('Others')
-        codes.append('Others')
-        scores.append(lca.score - np.sum(scores))
+        if norm:
+            scores = [s / totals[column] * 100 for s in scores]
 
-    if norm:
-        scores = [s / lca.score * 100 for s in scores]
+        dfs[method] = pd.DataFrame(index=labels, data=scores, columns=[method]).sort_values(by=[method],
+                                                                                           ascending=True)
+    return dfs
 
-    return pd.DataFrame(index=codes, data=scores, columns=[method]).sort_values(by=[method], ascending=True)
+
+def contributions_df(activity, method, limit=0.01, limit_type='percent', group_by_other=False, norm=False,
+                     store=None, index='code'):
+    """Gather in a dataframe the main contributors of the lca score
+
+    Parameters
+    ----------
+    activity : dict
+        Activity to be analyzed.
+    method : tuple
+        Impact category method.
+    limit: float, optional
+        Relative threshold of the total lca score from which contributors are displayed : (0.01 by default).
+    limit_type : str, optional
+        Percentage or number for the threshold ('percent' by default).
+    group_by_other : bool, optional
+        Group the other contributors into an 'other' category (True by default).
+    norm : bool, optional
+        Norm the contributions (False by default).
+    store : ResultStore, optional
+        Store of results to read and update (a new one by default).
+    index : str, optional
+        Field of the contributors used as index, 'code' or 'id' ('code' by default). The codes are only unique within
+        a database, use the ids to look the contributors up again, e.g. with ``activity_names``.
+
+    Returns
+    -------
+    pd.DataFrame
+        main contributors to the lca score.
+    """
+    return contributions_dfs(activity, [method], limit=limit, limit_type=limit_type, group_by_other=group_by_other,
+                             norm=norm, store=store, index=index)[method]
@@ -1,4 +1,4 @@
-from .database_explorer import ListAct
+from bw_visualization.utils import lazy_getattr
 
 
 def plot(database,
@@ -14,10 +14,17 @@ def plot(database,
          list_act_input=None,
          strict=False,
          ):
+    from .database_explorer import ListAct
+
     list_act = ListAct(database, name, methods_ef, methods_cc, location, unit, list_act_input)
     list_act.search(strict=strict)
     app = list_act.dashboard(i, method_cc, cutoff, amount)
     app.run_server(port=8058, debug=True, use_reloader=False)
 
 
+# exports are imported on first access, so that the traversal utilities can be used without loading Dash
+__getattr__ = lazy_getattr(__name__, {
+    'ListAct': ('.database_explorer', 'ListAct'),
+})
+
 __all__ = ['plot', ]
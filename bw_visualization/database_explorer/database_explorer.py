@@ -9,7 +9,8 @@ import bw2data as bwd
 import bw2calc as bwc
 from IPython.display import display
 
-from .utils import calculate_dashboard, plot_dashboard
+from bw_visualization.cache import traversal_key, load_traversal, save_traversal
+from .utils import calculate_dashboard, plot_dashboard, get_activities_metadata
 
 plt.style.use("ggplot")
 
@@ -311,12 +312,11 @@ class ListAct:
         if save:
             pdf.close()
 
-    def dashboard(self, i, method, cutoff, amount=1):
+    def dashboard(self, i, method, cutoff, amount=1, use_cache=True):
         act = self.list_act[i]
 
+        # the inventory is only calculated if the traversal is not in the cache
         lca = bwc.LCA({act: amount}, method)
-        lca.lci()
-        lca.lcia()
 
         (
             df,
@@ -325,7 +325,7 @@ class ListAct:
             fig_sunburst_neg,
             fig_waterfall,
             fig_sankey,
-        ) = calculate_dashboard(lca, cutoff)
+        ) = calculate_dashboard(lca, cutoff, use_cache=use_cache)
 
         app = plot_dashboard(
             df, lca, fig_sunburst_pos, fig_sunburst_neg, fig_waterfall, fig_sankey
@@ -333,28 +333,78 @@ class ListAct:
         return app
 
     # Functions prior to the dashboard
-    def plot_sankey(self, i, method, cutoff, amount=1):
+    def calculate_graph_traversal(self, i, method, cutoff, amount=1, use_cache=True):
+        """
+        Traverse the supply chain of an activity with ``bw2calc.GraphTraversal``, reusing the result stored in the
+        traversal cache of the project if the activity, method, cutoff and databases did not change.
+
+        Parameters
+        ----------
+        i : int
+            Index of the activity in the list.
+        method : tuple
+            Impact assessment method.
+        cutoff : float
+            Cutoff criteria of the traversal.
+        amount : float (default=1)
+            Amount of the functional unit.
+        use_cache : bool (default=True)
+            Read and write the traversal cache.
+
+        Returns
+        -------
+        dict
+            Total score (``impact``), matrix indices of the nodes (``nodes``), edges as ``to``, ``from`` and
+            ``impact`` arrays (``edges``) and name and location of the nodes by matrix index (``metadata``).
+        """
+        act = self.list_act[i]
+        key = traversal_key("graph_traversal", {act: amount}, method, cutoff=cutoff)
+        cached = load_traversal(key) if use_cache else None
+        if cached is None:
+            gt = bwc.GraphTraversal().calculate({act: amount}, method=method, cutoff=cutoff)
+            id_to_key = {v: k for k, v in gt["lca"].activity_dict.items()}
+            ids = list(gt["nodes"].keys())
+            metadata = get_activities_metadata(id_to_key[id] for id in ids[1:])
+            arrays = dict(
+                nodes=np.array(ids, dtype=int),
+                edge_to=np.array([edge["to"] for edge in gt["edges"]], dtype=int),
+                edge_from=np.array([edge["from"] for edge in gt["edges"]], dtype=int),
+                edge_impact=np.array([edge["impact"] for edge in gt["edges"]], dtype=float),
+                names=np.array([metadata[id_to_key[id]]["name"] for id in ids[1:]], dtype=str),
+                locations=np.array([metadata[id_to_key[id]]["location"] for id in ids[1:]], dtype=str),
+            )
+            cached = arrays, {"impact": gt["lca"].score}
+            if use_cache:
+                save_traversal(key, *cached)
+
+        arrays, metadata = cached
+        ids = arrays["nodes"].tolist()
+        return {
+            "impact": metadata["impact"],
+            "nodes": ids,
+            "edges": {col: arrays["edge_" + col] for col in ("to", "from", "impact")},
+            "metadata": {
+                id: {"name": name, "location": location}
+                for id, name, location in zip(ids[1:], arrays["names"].tolist(), arrays["locations"].tolist())
+            },
+        }
+
+    def plot_sankey(self, i, method, cutoff, amount=1, use_cache=True):
         act = self.list_act[i]
-        lca = bwc.LCA({act: amount}, method)
-        lca.lci()
-        lca.lcia()
-        impact = lca.score
         unit = bwd.Method(method).metadata["unit"]
 
-        gt = bwc.GraphTraversal().calculate({act: amount}, method=method, cutoff=cutoff)
+        gt = self.calculate_graph_traversal(i, method, cutoff, amount, use_cache=use_cache)
+        impact = gt["impact"]
 
-        acts = gt["lca"].activity_dict
-        id_to_key = {v: k for k, v in acts.items()}
-        # labels = {k: bw.get_activity(v)["name"] for k in gt["nodes"].values()}
-        ids = list(gt["nodes"].keys())
-        labels = [bwd.get_activity(id_to_key[id])["name"] for id in ids[1:]]
+        ids = gt["nodes"]
+        labels = [gt["metadata"][id]["name"] for id in ids[1:]]
         labels = ["root"] + labels
         id_to_idx = {id: idx for idx, id in enumerate(ids)}
         edges = gt["edges"]
         edges_plot = dict(
-            target=[id_to_idx[edge["to"]] for edge in edges],
-            source=[id_to_idx[edge["from"]] for edge in edges],
-            value=[edge["impact"] / impact * 100 for edge in edges],
+            target=[id_to_idx[id] for id in edges["to"].tolist()],
+            source=[id_to_idx[id] for id in edges["from"].tolist()],
+            value=(edges["impact"] / impact * 100).tolist(),
         )
 
         fig = go.Figure(
@@ -387,39 +437,33 @@ class ListAct:
                 else:
                     fig.show()
 
-    def plot_sunburst(self, i, method, cutoff, amount=1):
+    def plot_sunburst(self, i, method, cutoff, amount=1, use_cache=True):
         act = self.list_act[i]
-        lca = bwc.LCA({act: amount}, method)
-        lca.lci()
-        lca.lcia()
-        impact = lca.score
         unit = bwd.Method(method).metadata["unit"]
 
-        gt = bwc.GraphTraversal().calculate({act: amount}, method=method, cutoff=cutoff)
+        gt = self.calculate_graph_traversal(i, method, cutoff, amount, use_cache=use_cache)
+        impact = gt["impact"]
 
         # Label
-        acts = gt["lca"].activity_dict
-        id_to_key = {v: k for k, v in acts.items()}
-
-        ids = list(gt["nodes"].keys())
-        labels = [bwd.get_activity(id_to_key[id])["name"] for id in ids[1:]]
-        labels_loc = [bwd.get_activity(id_to_key[id])["location"] for id in ids[1:]]
+        metadata = gt["metadata"]
+        ids = gt["nodes"]
+        labels = [metadata[id]["name"] for id in ids[1:]]
+        labels_loc = [metadata[id]["location"] for id in ids[1:]]
         labels = [
             label + " " + label_loc for label, label_loc in zip(labels, labels_loc)
         ]
         # Source
-        edges = gt["edges"]
-        edges = edges[: len(labels)]
-        ids_source = [edge["to"] for edge in edges]
+        edges = {col: values[: len(labels)] for col, values in gt["edges"].items()}
+        ids_source = edges["to"].tolist()
         ids_source = [
-            bwd.get_activity(id_to_key[id])["name"]
+            metadata[id]["name"]
             + " "
-            + bwd.get_activity(id_to_key[id])["location"]
+            + metadata[id]["location"]
             for id in ids_source[1:]
         ]
         ids_source = [""] + ids_source
         # Value
-        value = [edge["impact"] for edge in edges]
+        value = edges["impact"].tolist()
         # Data dictionary
         data = dict(label=labels, location=labels_loc, parent=ids_source, value=value)
         df = pd.DataFrame.from_dict(data)
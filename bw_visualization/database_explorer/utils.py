@@ -1,16 +1,80 @@
 # modified version of the AssumeDiagonalGraphTraversal.
 # includes separate calculation of positive and negative impact
 import warnings
-import math
 
 from heapq import heappop, heappush
 import numpy as np
 import pandas as pd
 from bw2calc import spsolve
 import bw2data as bd
-import plotly.graph_objects as go
-from dash import Dash, dcc, html
-import dash_bootstrap_components as dbc
+from bw2data.backends import ActivityDataset
+from scipy.sparse.linalg import splu
+
+from bw_visualization.cache import traversal_key, load_traversal, save_traversal
+from bw_visualization.utils import lazy_import
+
+go = lazy_import("plotly.graph_objects")
+
+# Columns of the traversal edge table and their types. Every edge starts a new supply chain path, which is
+# identified by the row number of the edge (``path_id``). Edges into the functional unit have the parent path ``-1``.
+EDGE_COLUMNS = {
+    "path_id": int,
+    "parent_path_id": int,
+    "activity": int,
+    "depth": int,
+    "amount": float,
+    "exc_amount": float,
+    "impact": float,
+    "impact_neg": float,
+    "impact_pos": float,
+}
+# Fields of the traversal nodes. The functional unit node (``-1``) has no ``cum_neg`` and ``cum_pos``.
+NODE_FIELDS = ("amount", "cum", "cum_neg", "cum_pos", "ind")
+
+
+
+def factorize(matrix):
+    """
+    Factorize a sparse matrix once, for the solves of a traversal.
+
+    ``bw2calc.factorized`` is ``scipy.sparse.linalg.factorized``, which returns the ``solve`` of umfpack when
+    scikit-umfpack is installed, and that one only accepts right-hand side vectors. The ``solve`` of SuperLU accepts
+    vectors and ``(n, k)`` blocks alike.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.spmatrix
+        Square matrix to factorize, e.g. the technosphere matrix.
+
+    Returns
+    -------
+    callable
+        Function solving the system for a right-hand side vector or block.
+    """
+    return splu(matrix.tocsc()).solve
+
+
+def column_solver(solver):
+    """
+    Wrap a solver which only accepts right-hand side vectors, to solve ``(n, k)`` blocks one column at a time.
+
+    Parameters
+    ----------
+    solver : callable
+        Function solving a system for one right-hand side vector, e.g. the umfpack ``solve`` of
+        ``bw2calc.factorized``.
+
+    Returns
+    -------
+    callable
+        Function solving the system for a right-hand side vector or block.
+    """
+    def solve(rhs):
+        if rhs.ndim == 1:
+            return solver(rhs)
+        return np.column_stack([solver(column) for column in rhs.T])
+
+    return solve
 
 
 class JRCAssumedDiagonalGraphTraversal:
@@ -28,7 +92,7 @@ class JRCAssumedDiagonalGraphTraversal:
     <http://chris.mutel.org/multioutput.html>`__ for a description of multioutput process math in LCA).
     """
 
-    def calculate(self, lca, cutoff=0.005, max_calc=1e5, skip_coproducts=False):
+    def calculate(self, lca, cutoff=0.005, max_calc=1e5, skip_coproducts=False, batch_size=1, adjoint=False):
         """Traverse the supply chain graph.
 
         Parameters
@@ -40,11 +104,21 @@ class JRCAssumedDiagonalGraphTraversal:
             a dataset has a score less than 0.5 percent of the total.
         max_calc : int (default=10000)
             Maximum number of LCA calculations to perform.
+        skip_coproducts : bool (default=False)
+            Skip technosphere inputs with a negative (coproduct) amount.
+        batch_size : int (default=1)
+            Maximum number of children whose demands are solved together as one right-hand side block. Larger
+            values trade memory (``batch_size`` dense vectors of the technosphere size) for fewer solver calls.
+        adjoint : bool (default=False)
+            Compute the unit cumulative scores of all activities up front with one transposed solve (see
+            ``unit_cumulative_scores``), so that every cumulative score of the traversal is a lookup.
 
         Returns
         -------
         dict
-            Dictionary of nodes, edges, and number of LCA calculations.
+            Dictionary of nodes, edges (as a dictionary of ``EDGE_COLUMNS`` arrays), number of LCA calculations, and
+            number of cumulative scores taken from the per-activity score cache (``cache_hits``), solved for it
+            (``cache_misses``, none in adjoint mode) or read for it from the adjoint unit scores (``adjoint_lookups``).
         """
         if not hasattr(lca, "supply_array"):
             lca.lci()
@@ -56,6 +130,8 @@ class JRCAssumedDiagonalGraphTraversal:
 
         if score == 0:
             raise ValueError("Zero total LCA score makes traversal impossible")
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
 
         # Create matrix of LCIA CFs times biosphere flows, as these don't
         # change. This is also the unit score of each activity.
@@ -67,13 +143,34 @@ class JRCAssumedDiagonalGraphTraversal:
         characterized_biosphere_pos = characterized_biosphere.copy()
         characterized_biosphere_pos[characterized_biosphere_pos < 0] = 0
 
+        if adjoint:
+            solver = None
+            unit_scores = self.unit_cumulative_scores(
+                lca,
+                characterized_biosphere,
+                characterized_biosphere_neg,
+                characterized_biosphere_pos,
+            )
+        else:
+            # Factorize the technosphere matrix once, every cumulative score of the
+            # traversal is then a cheap solve against the same decomposition.
+            solver = factorize(lca.technosphere_matrix)
+            unit_scores = None
+        # Cumulative scores only depend on the activity, so they are computed once per matrix index and shared by
+        # every path reaching the same activity.
+        cache = {}
+
         heap, nodes, edges = self.initialize_heap(
             lca,
             supply,
             characterized_biosphere,
             characterized_biosphere_neg,
             characterized_biosphere_pos,
+            solver,
+            cache,
+            unit_scores,
         )
+        initial_calculations = len(cache)
         nodes, edges, counter = self.traverse(
             heap,
             nodes,
@@ -88,12 +185,24 @@ class JRCAssumedDiagonalGraphTraversal:
             characterized_biosphere_pos,
             lca,
             skip_coproducts,
+            solver,
+            int(batch_size),
+            cache,
+            unit_scores,
         )
 
         return {
             "nodes": nodes,
-            "edges": edges,
+            "edges": {
+                column: np.asarray(edges[column], dtype=dtype)
+                for column, dtype in EDGE_COLUMNS.items()
+            },
             "counter": counter,
+            # Each cache entry is one computed activity, every other calculation was a lookup in the cache. The
+            # entries are solved, unless they are read from the unit scores of the adjoint mode.
+            "cache_hits": counter - (len(cache) - initial_calculations),
+            "cache_misses": 0 if adjoint else len(cache),
+            "adjoint_lookups": len(cache) if adjoint else 0,
         }
 
     def initialize_heap(
@@ -103,14 +212,21 @@ class JRCAssumedDiagonalGraphTraversal:
         characterized_biosphere,
         characterized_biosphere_neg,
         characterized_biosphere_pos,
+        solver=None,
+        cache=None,
+        unit_scores=None,
     ):
         """Create a `priority queue <http://docs.python.org/2/library/heapq.html>`_ or ``heap`` to store inventory
         datasets, sorted by LCA score. Populates the heap with each activity in ``demand``. Initial nodes are the
         *functional unit*, i.e. the complete demand, and each activity in the *functional unit*. Initial edges are
         inputs from each activity into the *functional unit*. The *functional unit* is an abstract dataset (as it
-        doesn't exist in the matrix), and is assigned the index ``-1``.
+        doesn't exist in the matrix), and is assigned the index ``-1``. ``solver`` is an optional factorized
+        technosphere matrix, see ``cumulative_score``. The scores of the demanded activities are stored in the
+        optional ``cache`` dictionary, see ``traverse``. If ``unit_scores`` are given, they are used instead of
+        ``solver``.
         """
-        heap, edges = [], []
+        heap = []
+        edges = {column: [] for column in EDGE_COLUMNS}
         nodes = {-1: {"amount": 1, "cum": lca.score, "ind": 1e-6 * lca.score}}
         for index, amount in enumerate(lca.demand_array):
             if amount == 0:
@@ -122,8 +238,11 @@ class JRCAssumedDiagonalGraphTraversal:
                 characterized_biosphere_neg,
                 characterized_biosphere_pos,
                 lca,
+                solver,
+                unit_scores,
             )
-            heappush(heap, (abs(1 / cum_score), index, str(index)))
+            if cache is not None:
+                cache[index] = (cum_score, cum_score_neg, cum_score_pos)
             nodes[index] = {
                 "amount": float(supply[index]),
                 "cum": cum_score,
@@ -131,19 +250,28 @@ class JRCAssumedDiagonalGraphTraversal:
                 "cum_pos": cum_score_pos,
                 "ind": self.unit_score(index, supply, characterized_biosphere),
             }
-            edges.append(
-                {
-                    "to": -1,
-                    "from": str(index),
-                    "amount": amount,
-                    "exc_amount": amount,
-                    "impact": cum_score * amount / float(supply[index]),
-                    "impact_neg": cum_score_neg * amount / float(supply[index]),
-                    "impact_pos": cum_score_pos * amount / float(supply[index]),
-                }
+            path_id = self.add_edge(
+                edges,
+                parent_path_id=-1,
+                activity=index,
+                depth=1,
+                amount=amount,
+                exc_amount=amount,
+                impact=cum_score * amount / float(supply[index]),
+                impact_neg=cum_score_neg * amount / float(supply[index]),
+                impact_pos=cum_score_pos * amount / float(supply[index]),
             )
+            heappush(heap, (abs(1 / cum_score), index, path_id))
         return heap, nodes, edges
 
+    def add_edge(self, edges, **values):
+        """Append one edge to the ``EDGE_COLUMNS`` lists of ``edges`` and return the id of the path it starts"""
+        path_id = len(edges["path_id"])
+        edges["path_id"].append(path_id)
+        for column, value in values.items():
+            edges[column].append(value)
+        return path_id
+
     def cumulative_score(
         self,
         index,
@@ -152,8 +280,15 @@ class JRCAssumedDiagonalGraphTraversal:
         characterized_biosphere_neg,
         characterized_biosphere_pos,
         lca,
+        solver=None,
+        unit_scores=None,
     ):
-        """Compute cumulative LCA score for a given activity"""
+        """Compute cumulative LCA score for a given activity.
+
+        ``solver`` is the technosphere matrix factorized with ``factorize``. If not given, the linear system is solved
+        from scratch with ``bw2calc.spsolve``. If the ``unit_scores`` of all activities are given (see
+        ``unit_cumulative_scores``), no linear system is solved at all.
+        """
         demand = np.zeros((supply.shape[0],))
         demand[index] = (
             supply[index]
@@ -161,13 +296,83 @@ class JRCAssumedDiagonalGraphTraversal:
             # Normalize by the production amount
             lca.technosphere_matrix[index, index]
         )
-        solved_tech = spsolve(lca.technosphere_matrix, demand)
+        if unit_scores is not None:
+            return tuple(float(score) for score in unit_scores[:, index] * demand[index])
+        if solver is None:
+            solved_tech = spsolve(lca.technosphere_matrix, demand)
+        else:
+            solved_tech = solver(demand)
         return (
             float((characterized_biosphere * solved_tech).sum()),
             float((characterized_biosphere_neg * solved_tech).sum()),
             float((characterized_biosphere_pos * solved_tech).sum()),
         )
 
+    def cumulative_scores(
+        self,
+        indices,
+        supply,
+        characterized_biosphere,
+        characterized_biosphere_neg,
+        characterized_biosphere_pos,
+        lca,
+        solver=None,
+        unit_scores=None,
+        diagonal=None,
+    ):
+        """Compute cumulative LCA scores for several activities at once.
+
+        The demand vectors of all ``indices`` are stacked into one right-hand side block, which is solved in a single
+        call and characterized with a single matrix product. Returns an array of shape ``(3, len(indices))`` with the
+        total, negative and positive cumulative scores, see ``cumulative_score``. ``solver`` must accept ``(n, k)``
+        blocks, like the one of ``factorize``, wrap solvers of single vectors with ``column_solver``. ``diagonal`` is
+        the optional precomputed diagonal of the technosphere matrix.
+        """
+        indices = np.asarray(indices, dtype=int)
+        columns = np.arange(indices.shape[0])
+        demand = np.zeros((supply.shape[0], indices.shape[0]))
+        if diagonal is None:
+            diagonal = lca.technosphere_matrix.diagonal()
+        # Normalize by the production amount
+        demand[indices, columns] = supply[indices] * diagonal[indices]
+        if unit_scores is not None:
+            return unit_scores[:, indices] * demand[indices, columns]
+        if solver is None:
+            solved_tech = spsolve(lca.technosphere_matrix, demand)
+        else:
+            solved_tech = solver(demand)
+        # Single column blocks are returned as vectors by some solvers
+        solved_tech = solved_tech.reshape(supply.shape[0], indices.shape[0])
+        return np.vstack(
+            (
+                characterized_biosphere,
+                characterized_biosphere_neg,
+                characterized_biosphere_pos,
+            )
+        ) @ solved_tech
+
+    def unit_cumulative_scores(
+        self,
+        lca,
+        characterized_biosphere,
+        characterized_biosphere_neg,
+        characterized_biosphere_pos,
+    ):
+        """Compute the cumulative LCA score per unit of reference product of every activity.
+
+        Instead of solving :math:`Ax=b` once per activity, the adjoint system :math:`A^Ty=c` is solved once for the
+        total, negative and positive characterized biosphere. Column ``i`` of the returned ``(3, n)`` array times
+        ``supply[i] * A[i, i]`` is the result of ``cumulative_score`` for activity ``i``.
+        """
+        rhs = np.vstack(
+            (
+                characterized_biosphere,
+                characterized_biosphere_neg,
+                characterized_biosphere_pos,
+            )
+        ).T
+        return spsolve(lca.technosphere_matrix.T.tocsc(), rhs).reshape(rhs.shape).T
+
     def unit_score(self, index, supply, characterized_biosphere):
         """Compute the LCA impact caused by the direct emissions and resource consumption of a given activity"""
         return float(characterized_biosphere[index] * supply[index])
@@ -187,16 +392,31 @@ class JRCAssumedDiagonalGraphTraversal:
         characterized_biosphere_pos,
         lca,
         skip_coproducts,
+        solver=None,
+        batch_size=1,
+        cache=None,
+        unit_scores=None,
     ):
         """
         Build a directed graph by traversing the supply chain.
-        Node ids are actually technosphere row/col indices, which makes lookup easier.
+        Node ids are actually technosphere row/col indices, which makes lookup easier. Edges are appended to the
+        ``EDGE_COLUMNS`` lists of ``edges``, heap entries refer to the path of their parent edge by its ``path_id``.
+        The cumulative scores of the children of each parent are computed in blocks of ``batch_size`` activities,
+        see ``cumulative_scores``. ``cache`` maps matrix indices to their already computed ``(cum, cum_neg, cum_pos)``
+        scores and is updated in place. If ``unit_scores`` are given, they are used instead of ``solver``.
 
         Returns
         ----------
         tuple
             a tuple of (nodes, edges, number of calculations)
         """
+        if cache is None:
+            cache = {}
+        # Columns are sliced straight from the CSC arrays, and the production amounts read from the diagonal, as
+        # indexing single elements of a sparse matrix is slow.
+        technosphere = lca.technosphere_matrix.tocsc(copy=True)
+        technosphere.sum_duplicates()
+        diagonal = technosphere.diagonal()
         # static_databases = {name for name in databases if databases[name].get("static")}
         # reverse = lca.dicts.activity.reversed
 
@@ -206,69 +426,80 @@ class JRCAssumedDiagonalGraphTraversal:
                 break
             parent = heappop(heap)
             parent_index = parent[1]
-            full_path_parent = parent[2]
+            parent_path_id = parent[2]
+            depth = edges["depth"][parent_path_id] + 1
             # Skip links from static databases
             # if static_databases and reverse[parent_index][0] in static_databases:
             #     continue
 
             # Assume that this activity produces its reference product
-            scale_value = lca.technosphere_matrix[parent_index, parent_index]
+            scale_value = diagonal[parent_index]
             if scale_value == 0:
                 raise ValueError(
                     "Can't rescale activities that produce zero reference product"
                 )
-            col = lca.technosphere_matrix[:, parent_index].tocoo()
+            start, end = technosphere.indptr[parent_index:parent_index + 2]
+            rows = technosphere.indices[start:end]
+            values = technosphere.data[start:end]
             # Multiply by -1 because technosphere values are negative
             # (consumption of inputs) and rescale
-            children = [
-                (int(col.row[i]), float(-1 * col.data[i] / scale_value))
-                for i in range(col.row.shape[0])
-            ]
-            for activity, amount in children:
-                # Skip values on technosphere diagonal
-                if activity == parent_index:
-                    continue
-                # Skip negative coproducts
-                if skip_coproducts and amount <= 0:
-                    continue
-                counter += 1
-                full_path_id = full_path_parent + "-" + str(activity)
-                cumulative_score, cum_score_neg, cum_score_pos = self.cumulative_score(
-                    activity,
+            amounts = -1 * values / scale_value
+            # Skip values on technosphere diagonal and negative coproducts
+            mask = rows != parent_index
+            if skip_coproducts:
+                mask &= amounts > 0
+            rows, values, amounts = rows[mask], values[mask], amounts[mask]
+            counter += rows.shape[0]
+
+            # Only activities not reached through another path need to be solved
+            missing = [activity for activity in rows.tolist() if activity not in cache]
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                scores = self.cumulative_scores(
+                    batch,
                     supply,
                     characterized_biosphere,
                     characterized_biosphere_neg,
                     characterized_biosphere_pos,
                     lca,
+                    solver,
+                    unit_scores,
+                    diagonal,
                 )
-                if abs(cumulative_score) < abs(total_score * cutoff):
-                    continue
-
-                # flow between activity and parent (Multiply by -1 because technosphere values are negative)
-                flow = (
-                    -1.0
-                    * lca.technosphere_matrix[activity, parent_index]
-                    * supply[parent_index]
-                )
-                total_activity_output = (
-                    lca.technosphere_matrix[activity, activity] * supply[activity]
-                )
-
-                # Edge format is (to, from, mass amount, cumulative impact)
-                edges.append(
-                    {
-                        "to": full_path_parent,
-                        "from": full_path_id,
-                        # "full_path_id": full_path_id,
-                        # Amount of this link * amount of parent demanding link
-                        "amount": flow,
-                        # Raw exchange value
-                        "exc_amount": amount,
-                        # Impact related to this flow
-                        "impact": flow / total_activity_output * cumulative_score,
-                        "impact_neg": flow / total_activity_output * cum_score_neg,
-                        "impact_pos": flow / total_activity_output * cum_score_pos,
-                    }
+                cache.update(zip(batch, map(tuple, scores.T.tolist())))
+            if not rows.shape[0]:
+                continue
+            scores = np.array([cache[activity] for activity in rows.tolist()])
+            mask = np.abs(scores[:, 0]) >= abs(total_score * cutoff)
+            rows, values, amounts, scores = rows[mask], values[mask], amounts[mask], scores[mask]
+            # flow between activity and parent (Multiply by -1 because technosphere values are negative)
+            flows = -1.0 * values * supply[parent_index]
+            total_activity_outputs = diagonal[rows] * supply[rows]
+
+            for activity, amount, flow, total_activity_output, (
+                cumulative_score,
+                cum_score_neg,
+                cum_score_pos,
+            ) in zip(
+                rows.tolist(),
+                amounts.tolist(),
+                flows.tolist(),
+                total_activity_outputs.tolist(),
+                scores.tolist(),
+            ):
+                path_id = self.add_edge(
+                    edges,
+                    parent_path_id=parent_path_id,
+                    activity=activity,
+                    depth=depth,
+                    # Amount of this link * amount of parent demanding link
+                    amount=flow,
+                    # Raw exchange value
+                    exc_amount=amount,
+                    # Impact related to this flow
+                    impact=flow / total_activity_output * cumulative_score,
+                    impact_neg=flow / total_activity_output * cum_score_neg,
+                    impact_pos=flow / total_activity_output * cum_score_pos,
                 )
                 # Want multiple incoming edges, but don't add existing node
                 if activity in nodes:
@@ -284,91 +515,103 @@ class JRCAssumedDiagonalGraphTraversal:
                     # coming directory from or to this activity
                     "ind": self.unit_score(activity, supply, characterized_biosphere),
                 }
-                heappush(heap, (abs(1 / cumulative_score), activity, full_path_id))
+                heappush(heap, (abs(1 / cumulative_score), activity, path_id))
 
         return nodes, edges, counter
 
 
+def get_activities_metadata(ids, chunk_size=500):
+    """Fetch the name, location, unit and code of several activities at once.
+
+    Instead of one ``bd.get_activity`` query per activity, the ids are looked up with ``IN (...)`` queries of at most
+    ``chunk_size`` ids, to stay below the SQLite limit of query variables.
+
+    Returns
+    -------
+    dict
+        Dictionary from activity id to a dictionary with the ``name``, ``location``, ``unit`` and ``code`` fields.
+    """
+    ids = list(set(ids))
+    metadata = {}
+    for start in range(0, len(ids), chunk_size):
+        query = ActivityDataset.select().where(
+            ActivityDataset.id.in_(ids[start:start + chunk_size])
+        )
+        for row in query:
+            metadata[row.id] = {
+                "name": row.name,
+                "location": row.location,
+                "unit": row.data.get("unit"),
+                "code": row.code,
+            }
+    return metadata
+
+
 def separate_multiple_parent(df):
-    """Separate impacts from activities that have multiple parents to each branch"""
-    # add some helpful columns
-    df["act_id"] = df["ids"].apply(lambda x: x.split("-")[-1])
-    df["parent_act_id"] = df["parent_ids"].apply(lambda x: x.split("-")[-1])
-    df["depth"] = df["ids"].apply(lambda x: len(x.split("-")))
-    df["scaled_pos_impact"] = df["impact_pos"]
-    df["scaled_neg_impact"] = df["impact_neg"]
+    """Separate impacts from activities that have multiple parents to each branch.
 
+    ``df`` has one row per traversal edge, with the ``path_id``, ``parent_path_id``, ``act_id`` and ``depth`` columns
+    taken from the edge table (see ``EDGE_COLUMNS``).
+    """
     # calculate the overall impact of activities with multiple parents
     # if the same id is found several times, the impacts will be summed
-    grouped = df.groupby("act_id")
-    multi_parent_pos_sum = grouped["impact_pos"].sum()
-    multi_parent_neg_sum = grouped["impact_neg"].sum()
-    # get only the activities that have multiple parents sorting by depth allows us to traverse this later in
-    # ascending order (start with activities close to the functional unit). This might not be strictly neccessary
-    multi_parents = pd.concat(g for _, g in grouped if len(g) > 1).sort_values(
-        by="depth"
-    )
-    # and add the total impact
-    multi_parents["impact_pos_sum"] = multi_parents["act_id"].apply(
-        lambda x: multi_parent_pos_sum[x]
-    )
-    multi_parents["impact_neg_sum"] = multi_parents["act_id"].apply(
-        lambda x: multi_parent_neg_sum[x]
-    )
-
-    # display(multi_parents)
+    grouped = df.groupby("act_id")["impact_pos"]
+    is_multi_parent = (grouped.transform("size") > 1).to_numpy()
+    # share of this branch in the overall impact of the activity
+    share = (df["impact_pos"] / grouped.transform("sum")).to_numpy()
+
+    # row of the parent edge, -1 for the edges into the functional unit
+    parent_rows = pd.Index(df["path_id"]).get_indexer(df["parent_path_id"])
+    depth = df["depth"].to_numpy()
+
+    # scales[i, k] is the share of the k-th multi-parent ancestor of row i, starting from the functional unit. The
+    # children of every level inherit the scales of their parent, plus the share of the parent itself.
+    scales = np.full((len(df), depth.max(initial=1)), np.nan)
+    multi_parent_ancestors = np.zeros(len(df), dtype=int)
+    for level in range(2, depth.max(initial=1) + 1):
+        rows = np.flatnonzero(depth == level)
+        parents = parent_rows[rows]
+        scales[rows] = scales[parents]
+        multi = is_multi_parent[parents]
+        scales[rows[multi], multi_parent_ancestors[parents[multi]]] = share[parents[multi]]
+        multi_parent_ancestors[rows] = multi_parent_ancestors[parents] + multi
 
     # apply a user defined scale here we cheat a bit by flooring the value because sometimes the sums of the children
     # are bigger than the parent there is definitely a better way to do this - the best would be to separate the
-    # chains from the beginning in the GraphTraversal
-    def apply_scale(number, scale):
-        # return number * scale
-        return math.floor(number * scale * 100) / 100
-
-    # recursive function that scales all children to the share of this branch
-    def scale_children(multi_parent_id, scale):
-        child_rows = df.eval("parent_ids == @multi_parent_id")
-        df.loc[child_rows, "scaled_pos_impact"] = df.loc[
-            child_rows, "scaled_pos_impact"
-        ].apply(lambda x: apply_scale(x, scale))
+    # chains from the beginning in the GraphTraversal. The shares are applied one after the other, from the functional
+    # unit downwards, as the flooring makes the order matter.
+    scaled_pos_impact = df["impact_pos"].to_numpy(dtype=float, copy=True)
+    scaled_neg_impact = df["impact_neg"].to_numpy(dtype=float, copy=True)
+    for k in range(multi_parent_ancestors.max(initial=0)):
+        rows = multi_parent_ancestors > k
+        scaled_pos_impact[rows] = np.floor(scaled_pos_impact[rows] * scales[rows, k] * 100) / 100
         # double negative to make floor work in the right way
-        df.loc[child_rows, "scaled_neg_impact"] = df.loc[
-            child_rows, "scaled_neg_impact"
-        ].apply(lambda x: -apply_scale(-x, scale))
-        # repeat for all children: children become new parents
-        new_parents = df.loc[child_rows, "ids"]
-        for new_parent in new_parents:
-            scale_children(new_parent, scale)
-
-    for parent, impact, impact_sum in zip(
-            multi_parents["ids"],
-            multi_parents["impact_pos"],
-            multi_parents["impact_pos_sum"],
-    ):
-        # print(parent)
-        scale_children(parent, impact / impact_sum)
+        scaled_neg_impact[rows] = -(np.floor(-scaled_neg_impact[rows] * scales[rows, k] * 100) / 100)
+
+    df["scaled_pos_impact"] = scaled_pos_impact
+    df["scaled_neg_impact"] = scaled_neg_impact
     return df
 
 
 def plot_sankey(df, unit):
     # Put the data in a Sankey format. Strangely it didn't work with ids, so we just put integers as ids.
-    data_sankey = df.query('parent_ids != ""').to_dict(orient="list")
+    data_sankey = df.query("parent_path_id != -1").to_dict(orient="list")
     nodes, numbers = [], {}
     counter = 0
-    for id in data_sankey["ids"]:
+    for id in data_sankey["path_id"]:
         numbers[id] = counter
         nodes.append(data_sankey["label"][counter])
         counter += 1
     counter2 = 0
-    for id in data_sankey["parent_ids"]:
+    for id in data_sankey["parent_path_id"]:
         numbers[id] = counter
         nodes.append(data_sankey["parent"][counter2])
         counter += 1
         counter2 += 1
 
     links = dict(
-        source=[numbers[id] for id in data_sankey["ids"]],
-        target=[numbers[id] for id in data_sankey["parent_ids"]],
+        source=[numbers[id] for id in data_sankey["path_id"]],
+        target=[numbers[id] for id in data_sankey["parent_path_id"]],
         value=data_sankey["impact"],
         hovertemplate="<b>%{source.label}</b> to <b>%{target.label}</b><br>Impact: %{value:.2} "
                       + unit,
@@ -398,8 +641,9 @@ def plot_sankey(df, unit):
 
 def plot_sunbursts(df, unit):
     data_sunburst = df  # .query('depth < 5')
-    ids = list(data_sunburst["ids"])
-    parents = list(data_sunburst["parent_ids"])
+    # Sunburst ids are strings, the roots have an empty parent
+    ids = [str(id) for id in data_sunburst["path_id"]]
+    parents = [str(id) if id != -1 else "" for id in data_sunburst["parent_path_id"]]
     labels = list(data_sunburst["label"])
     labels_short = [label[:18] for label in labels]
     values_pos = list(data_sunburst["scaled_pos_impact"])
@@ -441,13 +685,13 @@ def plot_sunbursts(df, unit):
 
 
 def plot_waterfall(trav, unit):
-    main_edge = trav["edges"][0]
+    edges = trav["edges"]
     fig_waterfall = go.Figure(
         go.Waterfall(
             orientation="v",
             measure=["relative", "relative", "total"],
             x=["Emissions", "Absorptions", "Total"],
-            y=[main_edge["impact_pos"], main_edge["impact_neg"], main_edge["impact"]],
+            y=[edges["impact_pos"][0], edges["impact_neg"][0], edges["impact"][0]],
             decreasing={"marker": {"color": "aquamarine"}},
             increasing={"marker": {"color": "lightcoral"}},
         )
@@ -456,45 +700,130 @@ def plot_waterfall(trav, unit):
     return fig_waterfall
 
 
-def calculate_dashboard(lca, cutoff):
-    trav = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff)
-    print("Trasversal diagonal calculated.")
-    # name for the activities from activity_dict
+def traversal_to_arrays(trav):
+    """
+    Convert a traversal result of ``calculate_traversal`` to arrays and JSON metadata for the traversal cache.
+
+    Parameters
+    ----------
+    trav : dict
+        Result of ``calculate_traversal``.
+
+    Returns
+    -------
+    tuple
+        ``(arrays, metadata)`` to pass to ``bw_visualization.cache.save_traversal``.
+    """
+    nodes = trav["nodes"]
+    arrays = {"edge_" + col: trav["edges"][col] for col in EDGE_COLUMNS}
+    arrays["node_index"] = np.fromiter(nodes, dtype=int, count=len(nodes))
+    arrays["node_activity"] = np.array([trav["activities"].get(index, -1) for index in nodes], dtype=int)
+    for field in NODE_FIELDS:
+        arrays["node_" + field] = np.array([node.get(field, np.nan) for node in nodes.values()], dtype=float)
+    metadata = {key: trav[key] for key in ("counter", "cache_hits", "cache_misses", "adjoint_lookups")}
+    return arrays, metadata
+
+
+def traversal_from_arrays(arrays, metadata):
+    """
+    Rebuild a traversal result from the arrays and metadata stored by ``traversal_to_arrays``.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays loaded from the traversal cache.
+    metadata : dict
+        Metadata loaded from the traversal cache.
+
+    Returns
+    -------
+    dict
+        Traversal result, as returned by ``calculate_traversal``.
+    """
+    nodes = {}
+    activities = {}
+    fields = np.column_stack([arrays["node_" + field] for field in NODE_FIELDS])
+    for index, activity, values in zip(
+            arrays["node_index"].tolist(), arrays["node_activity"].tolist(), fields.tolist()
+    ):
+        nodes[index] = {field: value for field, value in zip(NODE_FIELDS, values) if value == value}
+        if activity != -1:
+            activities[index] = activity
+    return {
+        "nodes": nodes,
+        "edges": {col: arrays["edge_" + col] for col in EDGE_COLUMNS},
+        "activities": activities,
+        **metadata,
+    }
+
+
+def calculate_traversal(lca, cutoff, max_calc=1e5, use_cache=True):
+    """
+    Traverse the supply chain of an LCA with ``JRCAssumedDiagonalGraphTraversal``, reusing the result stored in the
+    traversal cache of the project if the demand, method, parameters and databases did not change.
+
+    Parameters
+    ----------
+    lca : bw2calc.LCA
+        LCA to traverse. ``lci`` and ``lcia`` are only run if the result is not cached.
+    cutoff : float
+        Cutoff criteria of the traversal.
+    max_calc : int (default=1e5)
+        Maximum number of LCA calculations to perform.
+    use_cache : bool (default=True)
+        Read and write the traversal cache.
+
+    Returns
+    -------
+    dict
+        Traversal result of ``JRCAssumedDiagonalGraphTraversal.calculate``, with the database ids of the nodes by
+        matrix index (``activities``).
+    """
+    key = traversal_key("jrc", lca.demand, lca.method, cutoff=cutoff, max_calc=max_calc)
+    cached = load_traversal(key) if use_cache else None
+    if cached is not None:
+        return traversal_from_arrays(*cached)
+
+    trav = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff, max_calc=max_calc)
     id_to_key = {v: k for k, v in lca.activity_dict.items()}
-    activities = {
-        str(id): bd.get_activity(id_to_key[id]) for id in list(trav["nodes"].keys())[1:]
+    trav["activities"] = {index: id_to_key[index] for index in trav["nodes"] if index != -1}
+    if use_cache:
+        save_traversal(key, *traversal_to_arrays(trav))
+    return trav
+
+
+def calculate_dashboard(lca, cutoff, use_cache=True):
+    trav = calculate_traversal(lca, cutoff, use_cache=use_cache)
+    print("Trasversal diagonal calculated.")
+    edges = trav["edges"]
+    # name for the activities from the database ids of the nodes
+    id_to_key = trav["activities"]
+    ids = list(trav["nodes"].keys())[1:]
+    metadata = get_activities_metadata(id_to_key[id] for id in ids)
+    names = {
+        id: metadata[id_to_key[id]]["name"] + " (" + metadata[id_to_key[id]]["location"] + ")"
+        for id in ids
     }
 
     # put all edge data in a dataframe to be able to scale the children of multi-parent processes
-    ids = [edge["from"] for edge in trav["edges"]]
-    labels = [
-        activities[id.split("-")[-1]]["name"]
-        + " ("
-        + activities[id.split("-")[-1]]["location"]
-        + ")"
-        for id in ids
-    ]
-    parent_ids = [""] + [edge["to"] for edge in trav["edges"]][1:]
+    is_root = edges["parent_path_id"] == -1
+    parent_act_ids = np.where(is_root, -1, edges["activity"][edges["parent_path_id"]])
+    labels = [names[id] for id in edges["activity"].tolist()]
 
     data = dict(
-        ids=ids,
+        path_id=edges["path_id"],
         label=labels,
         # location = [act['location'] for act in activities],
-        parent_ids=parent_ids,
-        parent=[
-            activities[id.split("-")[-1]]["name"]
-            + " ("
-            + activities[id.split("-")[-1]]["location"]
-            + ")"
-            if id != ""
-            else ""
-            for id in parent_ids
-        ],
+        parent_path_id=edges["parent_path_id"],
+        parent=[names[id] if id != -1 else "" for id in parent_act_ids.tolist()],
         labels_short=[label[:18] for label in labels],
-        impact_pos=[edge["impact_pos"] for edge in trav["edges"]],
-        impact_neg=[edge["impact_neg"] for edge in trav["edges"]],
-        impact=[edge["impact"] for edge in trav["edges"]],
-        flow_amount=[edge["amount"] for edge in trav["edges"]]
+        impact_pos=edges["impact_pos"],
+        impact_neg=edges["impact_neg"],
+        impact=edges["impact"],
+        flow_amount=edges["amount"],
+        act_id=edges["activity"],
+        parent_act_id=parent_act_ids,
+        depth=edges["depth"],
         # value_pct = value_pct
     )
     df = pd.DataFrame.from_dict(data)
@@ -522,6 +851,9 @@ def calculate_dashboard(lca, cutoff):
 def plot_dashboard(
         df, lca, fig_sunburst_pos, fig_sunburst_neg, fig_waterfall, fig_sankey
 ):
+    from dash import Dash, dcc, html
+    import dash_bootstrap_components as dbc
+
     method = lca.method
     unit = bd.Method(method).metadata["unit"]
 
@@ -1,12 +1,27 @@
-from plotly.graph_objects import Figure
+from typing import TYPE_CHECKING
 
-from .sankertainpy import generate_sankey
-from .utils import recursive_calculation_to_plotly
+from bw_visualization.utils import lazy_getattr
 
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
 
-def plot(data, method) -> Figure:
-    result = recursive_calculation_to_plotly(data, method)
+
+def plot(data, method, use_cache=True) -> "Figure":
+    from .sankertainpy import generate_sankey
+    from .utils import cached_calculation_to_plotly
+
+    result = cached_calculation_to_plotly(data, method, use_cache=use_cache)
     return generate_sankey(result, type=1)
 
 
-__all__ = ['plot', 'generate_sankey', 'recursive_calculation_to_plotly']
+# exports are imported on first access, so that the traversal can be used without loading plotly and matplotlib
+__getattr__ = lazy_getattr(__name__, {
+    'generate_sankey': ('.sankertainpy', 'generate_sankey'),
+    'recursive_calculation_to_plotly': ('.utils', 'recursive_calculation_to_plotly'),
+    'cached_calculation_to_plotly': ('.utils', 'cached_calculation_to_plotly'),
+    'SankeySession': ('.utils', 'SankeySession'),
+})
+
+__all__ = [
+    'plot', 'generate_sankey', 'recursive_calculation_to_plotly', 'cached_calculation_to_plotly', 'SankeySession'
+]
@@ -1,6 +1,71 @@
+import functools
+
 import numpy as np
-import plotly.graph_objects as go
-import matplotlib
+
+from bw_visualization.utils import lazy_import
+from .utils import stack_samples
+
+go = lazy_import("plotly.graph_objects")
+matplotlib = lazy_import("matplotlib")
+
+
+def rgba(color):
+    """
+    Format a color as plotly 'rgba(...)' string.
+
+    Parameters
+    ----------
+    color : tuple
+        Red, green, blue and alpha between 0 and 1, as returned by matplotlib colormaps.
+
+    Returns
+    -------
+    str
+        Color string with plain floats, also for numpy scalars.
+    """
+    return 'rgba' + str(tuple(float(c) for c in color))
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(name, values, alpha):
+    """
+    Colors of a matplotlib colormap as plotly color strings, computed once per colormap, values and alpha.
+
+    Parameters
+    ----------
+    name : str
+        Name of the colormap.
+    values : tuple
+        Positions in the colormap, between 0 and 1.
+    alpha : float
+        Opacity of the colors.
+
+    Returns
+    -------
+    tuple
+        One 'rgba(...)' string per value.
+    """
+    cmap = matplotlib.cm.get_cmap(name)
+    return tuple(rgba(cmap(value, alpha)) for value in values)
+
+
+def link_mc_mask(data):
+    """
+    Mask of the links with Monte Carlo samples. Links appended after the traversal, such as emissions, have none.
+
+    Parameters
+    ----------
+    data : dict
+        Data with 'scores' and 'mc_mask'.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array of the length of 'scores'.
+    """
+    is_mc = np.zeros(len(data['scores']), dtype=bool)
+    is_mc[:len(data['mc_mask'])] = data['mc_mask']
+    return is_mc
 
 
 def cut_off_flows(data, label_list, cutoff):
@@ -12,8 +77,10 @@ def cut_off_flows(data, label_list, cutoff):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     label_list: list
@@ -26,19 +93,17 @@ def cut_off_flows(data, label_list, cutoff):
     tuple
         data with appended cutoff flows.
     """
+    data = stack_samples(data)
     # Combine flows < cutoff to one node:
-    total_score = np.mean(data['scores'][0])
+    scores = np.asarray(data['scores'], dtype=float)
+    total_score = scores[0]
     label_list.append('Activities< cutoff')
     upstream = len(label_list) - 1
     label_list.append('Activities< cutoff downstream')
     downstream = len(label_list) - 1
 
-    for i, flow in enumerate(data['scores']):
-        if abs(np.mean(flow)) / abs(total_score) < cutoff:
-            if np.mean(flow) > 0:
-                data['sources'][i] = upstream
-            else:
-                data['sources'][i] = downstream
+    is_cut = np.abs(scores) / abs(total_score) < cutoff
+    data['sources'] = np.where(is_cut, np.where(scores > 0, upstream, downstream), data['sources']).tolist()
     return data, label_list
 
 
@@ -53,8 +118,10 @@ def add_emissions(i, data, label_list, upstream, downstream):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     label_list: list
@@ -69,14 +136,15 @@ def add_emissions(i, data, label_list, upstream, downstream):
     tuple
         data with appended emissions
     """
+    data = stack_samples(data)
     inp = 0
     out = 0
     for n, scr in enumerate(data['scores']):
         if data['sources'][n] == i:
-            out = out + np.mean(scr)
+            out = out + scr
 
         if data['targets'][n] == i:
-            inp = inp + np.mean(scr)
+            inp = inp + scr
 
     if inp != 0 and out != 0 and inp != out:
 
@@ -101,8 +169,10 @@ def calc_emissions(data, label_list):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     label_list: list
@@ -113,15 +183,27 @@ def calc_emissions(data, label_list):
     tuple
         data with appended calculated emissions.
     """
-    # iterate through nodes and link emissions to additional node
+    data = stack_samples(data)
     label_list.append('Emissions')
     upstream = len(label_list) - 1
     label_list.append('Emissions downstream')
     downstream = len(label_list) - 1
     data['nodes'][len(label_list) - 1] = {'name': 'Emissions'}
 
-    for _, (i, _) in enumerate(data['nodes'].items()):
-        data, label_list = add_emissions(i, data, label_list, upstream, downstream)
+    # balance of all nodes in one pass over the links, summed in link order like add_emissions
+    nodes = np.fromiter(data['nodes'], dtype=int, count=len(data['nodes']))
+    scores = np.asarray(data['scores'], dtype=float)
+    sources = np.asarray(data['sources'], dtype=int)
+    targets = np.asarray(data['targets'], dtype=int)
+    size = max(len(label_list), nodes.max() + 1, sources.max(initial=0) + 1, targets.max(initial=0) + 1)
+    out = np.bincount(sources, weights=scores, minlength=size)[nodes]
+    inp = np.bincount(targets, weights=scores, minlength=size)[nodes]
+
+    # the links added here start at the emission nodes, which have no inputs, so no balance changes on the way
+    emitting = (inp != 0) & (out != 0) & (inp != out)
+    data['scores'].extend((out - inp)[emitting].tolist())
+    data['sources'].extend(np.where(out[emitting] > 0, upstream, downstream).tolist())
+    data['targets'].extend(nodes[emitting].tolist())
 
     return data, label_list
 
@@ -135,8 +217,10 @@ def calc_quantile_flows(data, cutoff, barrier_free):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     cutoff: float
@@ -150,48 +234,54 @@ def calc_quantile_flows(data, cutoff, barrier_free):
         calculated quantile flows.
     """
     # Split flows with list of Monte Carlo datas into different quantiles
-    total_score = np.mean(data['scores'][0])
-    cmap = matplotlib.cm.get_cmap('RdYlGn')  # PRGn#RdYlGn
-    if barrier_free:
-        cmap = matplotlib.cm.get_cmap('BrBG')  # PRGn#RdYlGn
-    cmap_basic = matplotlib.cm.get_cmap('Blues')
+    data = stack_samples(data)
+    scores = np.asarray(data['scores'], dtype=float)
+    total_score = scores[0]
+    cmap_name = 'BrBG' if barrier_free else 'RdYlGn'  # PRGn#RdYlGn
     quantiles = np.arange(0.125, 0.925, 0.05)
     # neg_quantiles= np.arange(0.9,0.9,0.1)
+
+    # colors and labels of the quantile bands, for positive and (flipped) negative flows
+    basic_color = colormap_lut('Blues', (0.5,), 0.6)[0]
+    bands = {}
+    for negative, act_quantiles in ((False, quantiles), (True, np.flip(quantiles))):
+        values = act_quantiles - 0.025 if negative else 1 - act_quantiles
+        labels = [f'score between {round(qu - 0.05, 4)} quantile and {round(qu, 4)}' for qu in act_quantiles]
+        bands[negative] = (colormap_lut(cmap_name, tuple(values.tolist()), 0.9), labels)
+
+    # quantiles of all links at once, the links without Monte Carlo datas are constant
+    is_mc = link_mc_mask(data)
+    flow_quantiles = np.repeat(scores[:, None], len(quantiles), axis=1)
+    if is_mc.any():
+        flow_quantiles[is_mc] = np.quantile(data['samples'][data['mc_mask']], quantiles, axis=1).T
+
     new_targets, new_sources, new_scores, colors = [], [], [], []
     hoverlabel = []
-    for i, flow in enumerate(data['scores']):
-        if np.mean(flow) <= 0:
-            act_quantiles = np.flip(quantiles)
-        else:
-            act_quantiles = quantiles
-        if isinstance(flow, list) and abs(np.mean(flow) / total_score) > cutoff:
-            old_qu_score = 0
-            for _, qu in enumerate(act_quantiles):
-
-                new_scores.append(np.quantile(flow, qu) - old_qu_score)
-                new_targets.append(data['targets'][i])
-                new_sources.append(data['sources'][i])
+    for i, mean in enumerate(scores):
+        qu_scores = np.flip(flow_quantiles[i]) if mean <= 0 else flow_quantiles[i]
+        if is_mc[i] and abs(mean / total_score) > cutoff:
+            band_colors, band_labels = bands[bool(mean <= 0)]
+            old_qu_scores = np.concatenate(([0], qu_scores[:-1]))
+            new_scores.extend(qu_scores - old_qu_scores)
+            new_targets.extend([data['targets'][i]] * len(qu_scores))
+            new_sources.extend([data['sources'][i]] * len(qu_scores))
+            for k, (qu_score, old_qu_score) in enumerate(zip(qu_scores, old_qu_scores)):
                 if old_qu_score == 0:
-                    colors.append('rgba' + str(cmap_basic(0.5, 0.6)))
+                    colors.append(basic_color)
                     hoverlabel.append('score < 0.125 quantile')
                 else:
-                    if np.mean(flow) <= 0:
-                        colors.append('rgba' + str(cmap(qu - 0.025, 0.9)))
-                    else:
-                        colors.append('rgba' + str(cmap(1 - qu, 0.9)))
-                    hoverlabel.append(
-                        f'score between {round(qu - 0.05, 4)} quantile and {round(qu, 4)}'
-                        f' quantile ({round(np.quantile(flow, qu), 5)})')
-
-                old_qu_score = np.quantile(flow, qu)
+                    colors.append(band_colors[k])
+                    hoverlabel.append(f'{band_labels[k]} quantile ({round(qu_score, 5)})')
 
         else:  # Add flows without Monte Carlo datas
-            new_scores.append(np.mean(flow))
+            new_scores.append(mean)
             new_targets.append(data['targets'][i])
             new_sources.append(data['sources'][i])
-            colors.append('rgba' + str(cmap_basic(0.5, 0.6)))
-            for _, qu in enumerate(act_quantiles):
-                hoverlabel.append(f'score without MonteCarlo calculation ({round(np.quantile(flow, qu), 4)})')
+            colors.append(basic_color)
+            # the quantiles of links without Monte Carlo datas are all the same, so they are formatted once
+            label_scores = qu_scores if is_mc[i] else qu_scores[:1]
+            labels = [f'score without MonteCarlo calculation ({round(qu_score, 4)})' for qu_score in label_scores]
+            hoverlabel.extend(labels if is_mc[i] else labels * len(qu_scores))
     new_data = {'targets': new_targets, 'sources': new_sources, 'scores': new_scores, 'nodes': data['nodes'],
                 'colors': colors, 'metadata': data['metadata']}
     return new_data, hoverlabel
@@ -206,8 +296,10 @@ def calc_colors(data, cutoff, barrier_free):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     cutoff: float
@@ -220,20 +312,26 @@ def calc_colors(data, cutoff, barrier_free):
     tuple
         Calculated colors.
     """
-    total_score = np.mean(data['scores'][0])
+    data = stack_samples(data)
+    scores = np.asarray(data['scores'], dtype=float)
+    total_score = scores[0]
     if barrier_free:
         cmap_mc = matplotlib.cm.get_cmap('copper')
     else:
         cmap_mc = matplotlib.cm.get_cmap('YlOrRd')
     cmap_smc = matplotlib.cm.get_cmap('Blues')
 
-    max_std = max(np.std(fl) for fl in data['scores'])
+    # standard deviations of all links at once, zero for the links without Monte Carlo datas
+    is_mc = link_mc_mask(data)
+    stds = np.zeros(len(scores))
+    stds[is_mc] = data['samples'][data['mc_mask']].std(axis=1)
+    max_std = stds.max()
 
     data['colors'] = [0] * len(data['scores'])
     hoverlabel = [0] * len(data['scores'])
-    for i, flow in enumerate(data['scores']):
-        if isinstance(flow, list) and np.mean(flow) / total_score > cutoff:
-            scale = 1 - round(np.std(flow) / max_std, 2)
+    for i, (mean, std) in enumerate(zip(scores, stds)):
+        if is_mc[i] and mean / total_score > cutoff:
+            scale = 1 - round(std / max_std, 2)
             color = cmap_mc(scale, 0.9)
             new_color = []
             for k in [0, 1, 2]:
@@ -247,9 +345,9 @@ def calc_colors(data, cutoff, barrier_free):
 
         else:  # Add flows without Monte Carlo datas
             color = cmap_smc(0.5, 0.6)
-        hoverlabel[i] = f'score: {round(np.mean(flow), 5)}; std: {round(np.std(flow), 5)})'
-        data['colors'][i] = 'rgba' + str(color)
-        data['scores'][i] = np.mean(flow)
+        hoverlabel[i] = f'score: {round(mean, 5)}; std: {round(std, 5)})'
+        data['colors'][i] = rgba(color)
+        data['scores'][i] = mean
     return data, hoverlabel
 
 
@@ -261,8 +359,10 @@ def flip_negativ_values(data):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
 
@@ -287,8 +387,10 @@ def adjust_data(data, type, cutoff, emission, barrier_free):
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
         - 'metadata': Dictionary containing method and activity information.
     type: int
@@ -331,8 +433,10 @@ def generate_sankey(data, type=1, cutoff=0.05, emissions=True, method='', barrie
     data : dict
         - 'sources': List of int regarding the source nodes from 'nodes'.
         - 'targets': List of int regarding the target nodes from 'nodes'.
-        - 'scores': List of floats/list containing the weight of the links between the nodes from 'nodes'.
-            Monte Carlo results are wrapped in a nested list.
+        - 'scores': List of floats containing the weight of the links between the nodes from 'nodes'.
+        - 'samples': Array of the Monte Carlo samples of the links, of shape (n_links, mc_number). Monte Carlo
+            results wrapped in a nested list in 'scores' are also accepted (see ``stack_samples``).
+        - 'mc_mask': Boolean array, True for the links with Monte Carlo samples.
         - 'nodes': Dictionary containing information about the nodes. Keys are int values.
     type: int
         0 for visualize the uncertainty in form of colored intensity flows in relation to the standard deviation.
@@ -1,7 +1,14 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush
 from warnings import warn
 import bw2calc as bc
 import numpy as np
 from bw2data import get_activity
+from bw2data.backends import Activity, ActivityDataset
+
+from bw_visualization.cache import traversal_key, load_traversal, save_traversal
+from bw_visualization.utils import activate_project, project_location
 
 
 def update_or_create_nodes(nodes, activity, actual_node, parent_node, source, target, scores):
@@ -107,6 +114,116 @@ def calculate_score(activity, lca_obj, mc, amount, lcia_method, mc_number, total
     return lca_obj, total_score, score
 
 
+def stack_samples(data):
+    """
+    Move the Monte Carlo samples of nested lists in ``data['scores']`` to one array.
+
+    ``data['samples']`` becomes a ``(n_links, mc_number)`` array, in which the rows of links without Monte Carlo
+    samples repeat their score, and ``data['mc_mask']`` the mask of the links with samples. The score of these links
+    is replaced by the mean of their samples. Data that already has ``samples`` is returned unchanged.
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary with 'scores' as list of floats/list.
+
+    Returns
+    -------
+    dict
+        data with 'scores' as list of floats, 'samples' and 'mc_mask'.
+    """
+    if 'samples' in data:
+        return data
+    is_mc = np.array([isinstance(score, list) for score in data['scores']], dtype=bool)
+    mc_number = max((len(score) for score in data['scores'] if isinstance(score, list)), default=0)
+    samples = np.empty((len(data['scores']), mc_number))
+    for i, score in enumerate(data['scores']):
+        samples[i] = score
+    means = iter(samples[is_mc].mean(axis=1).tolist() if mc_number else [])
+    data['scores'] = [next(means) if is_mc[i] else score for i, score in enumerate(data['scores'])]
+    data['samples'] = samples
+    data['mc_mask'] = is_mc
+    return data
+
+
+def unit_node_score(subtree, activity, lca_obj, amount, mc_number, threshold):
+    """
+    Score of a node of the per-node Monte Carlo traversal, rescaled from the results per unit of product of its
+    activity. These are calculated at the first occurrence of the activity and stored in ``subtree``: the static
+    score, and the Monte Carlo samples once an occurrence is above the threshold.
+
+    Parameters
+    ----------
+    subtree : dict
+        Results per unit of product of the activity, updated in place.
+    activity : Activity
+        Activity of the node.
+    lca_obj : LCA
+        Stochastic LCA object of the traversal.
+    amount : float
+        Amount of the activity.
+    mc_number : int
+        Iterations of the monte carlo simulations.
+    threshold : float
+        Absolute score above which the node gets Monte Carlo samples.
+
+    Returns
+    -------
+    tuple
+        Score of the node (list of samples or float), and the score deciding whether to traverse deeper: the last
+        sample or the static score, like ``lca_obj.score`` after ``calculate_score``.
+    """
+    if 'score' not in subtree:
+        lca_obj.redo_lcia({activity.id: 1})
+        subtree['score'] = lca_obj.score
+    score = amount * subtree['score']
+    if abs(score) <= threshold:
+        return score, score
+    if 'samples' not in subtree:
+        lca_obj.redo_lcia({activity.id: 1})
+        subtree['samples'] = np.array([lca_obj.score for _ in zip(range(mc_number), lca_obj)])
+    samples = amount * subtree['samples']
+    return samples.tolist(), samples[-1]
+
+
+def unit_inputs(subtree, activity, lca_obj):
+    """
+    Technosphere inputs of an activity per unit of its product, read from the database at the first occurrence of
+    the activity and stored in ``subtree``.
+
+    Parameters
+    ----------
+    subtree : dict
+        Results per unit of product of the activity, updated in place.
+    activity : Activity
+        Activity to read.
+    lca_obj : LCA
+        LCA object of the traversal, giving the production amount.
+
+    Returns
+    -------
+    list or None
+        ``(input activity, amount)`` tuples in the order of the exchanges, None if the activity has several
+        production exchanges.
+    """
+    if 'inputs' not in subtree:
+        prod_exchanges = list(activity.production())
+        if not prod_exchanges:
+            prod_amount = 1
+        elif len(prod_exchanges) > 1:
+            subtree['inputs'] = None
+            return None
+        else:
+            prod_amount = lca_obj.technosphere_matrix[
+                lca_obj.dicts.product[prod_exchanges[0].input.id],
+                lca_obj.dicts.activity[prod_exchanges[0].output.id],
+            ]
+        subtree['inputs'] = [
+            (exc.input, exc["amount"] / prod_amount) for exc in activity.technosphere() if exc.input.id != exc.output.id
+        ]
+    return subtree['inputs']
+
+
 def recursive_calculation_to_plotly(
         activity,
         lcia_method,
@@ -116,20 +233,17 @@ def recursive_calculation_to_plotly(
         mc=False,
         mc_number=100,
         lca_obj=None,
-        total_score=None,
-        result_list=None,
-        level=0,
-        nodes=None,
-        source=None,
-        target=None,
-        actual_node=None,
-        scores=None,
-        parent_node=None,
-
+        vectorized_mc=True,
+        workers=1,
+        seed=None,
+        max_nodes=None,
+        importance_first=False,
 ):
     """
     Traverse a supply chain graph, and calculate the LCA scores of each component.
-    Adds a dictionary to result_list of the form.
+    Unless ``vectorized_mc`` is False with Monte Carlo simulation, the traversal is done on the matrices by
+    ``matrix_calculation_to_plotly``. Otherwise the exchanges are read from the database and every node is
+    calculated on its own, depth-first with an explicit stack.
 
     Parameters
     ----------
@@ -148,17 +262,21 @@ def recursive_calculation_to_plotly(
         wether Monte Carlo simulation should carry out or not.
     mc_number: int
         Iterations of the monte carlo simulations.
-
-    Internal args (used during recursion, do not touch)
-    ---------------------------------------------------
-    result_list
-    level
-    nodes
-    source
-    target
-    actual_node
-    scores
-    parent_node
+    lca_obj: LCA
+        LCA object with ``lcia`` done for ``lcia_method`` and the total score of ``activity``, to be used by the
+        traversal of ``matrix_calculation_to_plotly``.
+    vectorized_mc: bool
+        Draw the Monte Carlo iterations once for the whole tree (see ``matrix_calculation_to_plotly``) instead of
+        ``mc_number`` iterations per node.
+    workers: int
+        Number of processes drawing the Monte Carlo iterations of ``vectorized_mc``.
+    seed: int
+        Seed of the Monte Carlo simulation of ``vectorized_mc``, random if None.
+    max_nodes: int
+        Maximum number of links of the graph. The traversal stops with a warning when it is reached, no limit if None.
+    importance_first: bool
+        Spend ``max_nodes`` on the links with the highest absolute scores, with the traversal on the matrices only
+        (see ``SankeySession.view``).
 
     Returns
     -------
@@ -166,63 +284,570 @@ def recursive_calculation_to_plotly(
         Dictionary of the following lists:
             sources: List of int regarding the keys from 'nodes'.
             targets: List of int regarding the keys from 'nodes'.
-            scores: List of floats/list containing the weight of the links between the nodes from 'nodes'.
-                    Monte Carlo results are wrapped in a nested list.
+            scores: List of floats containing the weight of the links between the nodes from 'nodes', the mean of
+                    the samples for Monte Carlo results.
+            samples: Array of the Monte Carlo samples of the links, of shape (n_links, mc_number).
+            mc_mask: Boolean array, True for the links with Monte Carlo samples.
             nodes: Dictionary containing information about the nodes. Keys are int values
                    regarding the source/target values.
     """
 
-    activity = get_activity(activity)
+    if not mc or vectorized_mc:
+        return matrix_calculation_to_plotly(
+            activity, lcia_method, amount=amount, max_level=max_level, cutoff=cutoff, mc=mc, mc_number=mc_number,
+            lca_obj=lca_obj, workers=workers, seed=seed, max_nodes=max_nodes, importance_first=importance_first,
+        )
 
+    activity = get_activity(activity)
     nodes, actual_node, parent_node, source, target, scores = update_or_create_nodes(
-        nodes, activity, actual_node, parent_node, source, target, scores)
-    lca_obj, total_score, score = calculate_score(
-        activity, lca_obj, mc, amount, lcia_method, mc_number, total_score, cutoff
-    )
-
-    target.append(parent_node)
-    source.append(actual_node)
-    scores.append(score)
+        None, activity, None, None, None, None, None)
+    lca_obj, total_score = None, None
+    # results per unit of product of the activities met so far, rescaled for their other occurrences
+    subtrees = {}
 
-    if level < max_level and abs(lca_obj.score) > abs(total_score * cutoff):
-        prod_exchanges = list(activity.production())
-        if not prod_exchanges:
-            prod_amount = 1
-        elif len(prod_exchanges) > 1:
-            warn(f"Hit multiple production exchanges for {activity}; aborting in this branch")
-            return None
+    # depth-first in the order of the exchanges, as the Monte Carlo iterations of the nodes are drawn in turn
+    stack = [(activity, amount, parent_node, 0)]
+    while stack:
+        if max_nodes is not None and len(scores) >= max_nodes:
+            warn("Stopping traversal due to node count.")
+            break
+        activity, amount, parent_node, level = stack.pop()
+        actual_node = len(scores) + 1
+        subtree = subtrees.setdefault(activity.id, {})
+        if scores:
+            nodes, actual_node, parent_node, source, target, scores = update_or_create_nodes(
+                nodes, activity, actual_node, parent_node, source, target, scores)
+            score, last_score = unit_node_score(
+                subtree, activity, lca_obj, amount, mc_number, abs(total_score * cutoff)
+            )
         else:
-            prod_amount = lca_obj.technosphere_matrix[
-                lca_obj.dicts.product[prod_exchanges[0].input.id],
-                lca_obj.dicts.activity[prod_exchanges[0].output.id],
-            ]
-        actual_node_static = actual_node
+            lca_obj, total_score, score = calculate_score(
+                activity, lca_obj, mc, amount, lcia_method, mc_number, total_score, cutoff
+            )
+            last_score = lca_obj.score
 
-        for exc in activity.technosphere():
-            if exc.input.id == exc.output.id:
+        target.append(parent_node)
+        source.append(actual_node)
+        scores.append(score)
+
+        if level < max_level and abs(last_score) > abs(total_score * cutoff):
+            inputs = unit_inputs(subtree, activity, lca_obj)
+            if inputs is None:
+                warn(f"Hit multiple production exchanges for {activity}; aborting in this branch")
                 continue
+            children = [(exc_input, amount * unit_amount, actual_node, level + 1) for exc_input, unit_amount in inputs]
+            stack.extend(reversed(children))
 
-            tm_amount = exc["amount"]
-
-            target, source, scores, nodes, actual_node = recursive_calculation_to_plotly(
-                activity=exc.input,
-                lcia_method=lcia_method,
-                amount=amount * tm_amount / prod_amount,
-                max_level=max_level,
-                cutoff=cutoff,
-                mc=mc,
-                mc_number=mc_number,
-                result_list=result_list,
-                lca_obj=lca_obj,
-                total_score=total_score,
-                level=level + 1,
-                nodes=nodes,
-                source=source,
-                target=target,
-                actual_node=actual_node + 1,
-                scores=scores,
-                parent_node=actual_node_static,
-            )
-    if level == 0:
-        return {'targets': target, 'sources': source, 'scores': scores, 'nodes': nodes}
-    return target, source, scores, nodes, actual_node
+    return stack_samples({'targets': target, 'sources': source, 'scores': scores, 'nodes': nodes})
+
+
+def get_activities(ids, chunk_size=500):
+    """
+    Fetch several activities with ``IN (...)`` queries of at most ``chunk_size`` ids instead of one query each.
+
+    Parameters
+    ----------
+    ids : iterable
+        Database ids of the activities.
+    chunk_size : int
+        Maximum number of ids per query, to stay below the SQLite limit of query variables.
+
+    Returns
+    -------
+    dict
+        Activities by database id.
+    """
+    ids = list(set(ids))
+    activities = {}
+    for start in range(0, len(ids), chunk_size):
+        query = ActivityDataset.select().where(ActivityDataset.id.in_(ids[start:start + chunk_size]))
+        activities.update((ds.id, Activity(ds)) for ds in query)
+    return activities
+
+
+def sample_unit_scores(demand, lcia_method, product_ids, iterations, seed=None):
+    """
+    Draw Monte Carlo samples of the unit scores of several products.
+
+    Each iteration samples the matrices once and solves the transposed technosphere matrix once, so the cost does
+    not depend on the number of products.
+
+    Parameters
+    ----------
+    demand : dict
+        Demand of the stochastic LCA, used to select the matrices, as ``{activity id: amount}``.
+    lcia_method : tuple
+        LCIA method.
+    product_ids : list
+        Database ids of the products to score.
+    iterations : int
+        Number of Monte Carlo iterations.
+    seed : int
+        Seed of the random number generators of the LCA.
+
+    Returns
+    -------
+    np.ndarray
+        Unit scores, of shape ``(iterations, len(product_ids))``.
+    """
+    lca_obj = bc.LCA(demand, lcia_method, use_distributions=True, seed_override=seed)
+    lca_obj.load_lci_data()
+    lca_obj.load_lcia_data()
+    rows = [lca_obj.dicts.product[product_id] for product_id in product_ids]
+    samples = np.empty((iterations, len(rows)))
+    for iteration in range(iterations):
+        # resample the matrices, without solving the inventory of the demand
+        next(lca_obj)
+        characterized_biosphere = np.asarray(
+            (lca_obj.characterization_matrix @ lca_obj.biosphere_matrix).sum(axis=0)
+        ).ravel()
+        samples[iteration] = bc.spsolve(lca_obj.technosphere_matrix.T.tocsc(), characterized_biosphere)[rows]
+    return samples
+
+
+def init_sampling_worker(location):
+    """Activate the Brightway project of the parent process, given by ``project_location``, in a Monte Carlo worker."""
+    activate_project(*location)
+
+
+def parallel_sample_unit_scores(demand, lcia_method, product_ids, iterations, workers=1, seed=None):
+    """
+    Draw Monte Carlo samples of the unit scores of several products, split across worker processes.
+
+    Every worker draws a consecutive block of the iterations with ``sample_unit_scores``, seeded with its own seed
+    spawned from ``seed``, so the samples are reproducible for a given seed and number of workers.
+
+    Parameters
+    ----------
+    demand : dict
+        Demand of the stochastic LCA, used to select the matrices, as ``{activity id: amount}``.
+    lcia_method : tuple
+        LCIA method.
+    product_ids : list
+        Database ids of the products to score.
+    iterations : int
+        Number of Monte Carlo iterations.
+    workers : int
+        Number of worker processes. With 1, the iterations are drawn in the calling process.
+    seed : int
+        Master seed, random if None.
+
+    Returns
+    -------
+    np.ndarray
+        Unit scores, of shape ``(iterations, len(product_ids))``.
+    """
+    if workers < 1:
+        raise ValueError("workers must be a positive integer")
+    workers = max(min(workers, iterations), 1)
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(workers)]
+    chunks = [len(chunk) for chunk in np.array_split(np.arange(iterations), workers)]
+    if workers == 1:
+        return sample_unit_scores(demand, lcia_method, product_ids, iterations, seed=seeds[0])
+
+    # spawn, so that the workers do not share the SQLite connection of the parent process
+    with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_sampling_worker,
+            initargs=(project_location(),),
+    ) as executor:
+        futures = [
+            executor.submit(sample_unit_scores, demand, lcia_method, product_ids, chunk, chunk_seed)
+            for chunk, chunk_seed in zip(chunks, seeds)
+        ]
+        return np.vstack([future.result() for future in futures])
+
+
+def matrix_calculation_to_plotly(
+        activity,
+        lcia_method,
+        amount=1,
+        max_level=3,
+        cutoff=1e-2,
+        mc=False,
+        mc_number=100,
+        lca_obj=None,
+        workers=1,
+        seed=None,
+        max_nodes=None,
+        importance_first=False,
+):
+    """
+    Traverse a supply chain graph like ``recursive_calculation_to_plotly``, reading the exchanges from the
+    technosphere matrix of a single LCA instead of the database.
+
+    The scores of all nodes come from one solve of the transposed technosphere matrix: the unit score of every
+    product, so that the score of a node is its amount times the unit score of its product. Technosphere columns are
+    assumed to produce the product with the same id, as in ``lca_obj.dicts``. Exchanges with the same input are
+    summed, like in the matrix.
+
+    With Monte Carlo simulation, the tree is built from the static matrices and the iterations are drawn once for
+    the whole tree (``parallel_sample_unit_scores``). The root and the nodes whose static score is above the cutoff
+    of the median total score get their ``mc_number`` samples, the others keep their static score.
+
+    The traversal is a single ``view`` of a ``SankeySession``; use a session to look at several cutoffs and levels.
+
+    Parameters
+    ----------
+    activity: Activity
+        Starting point of the supply chain graph.
+    lcia_method: tuple
+        LCIA method to use when traversing supply chain graph.
+    amount: int
+        Amount of activity to assess.
+    max_level: int
+        Maximum depth to traverse.
+    cutoff: float
+        Fraction of total score to use as cutoff when deciding whether to traverse deeper and
+        if Monte Carlo simulation should be carried out.
+    mc: bool
+        wether Monte Carlo simulation should carry out or not.
+    mc_number: int
+        Iterations of the monte carlo simulations.
+    lca_obj: LCA
+        LCA object with ``lcia`` done for ``lcia_method``, built for ``activity`` if not given.
+    workers: int
+        Number of processes drawing the Monte Carlo iterations.
+    seed: int
+        Seed of the Monte Carlo simulation, random if None.
+    max_nodes: int
+        Maximum number of links of the graph. The traversal stops with a warning when it is reached, no limit if None.
+    importance_first: bool
+        Spend ``max_nodes`` on the links with the highest absolute scores instead of the first links in the order of
+        the exchanges (see ``SankeySession.view``).
+
+    Returns
+    -------
+    dict
+        Same dictionary as ``recursive_calculation_to_plotly``.
+    """
+    session = SankeySession(
+        activity, lcia_method, amount=amount, mc=mc, mc_number=mc_number, lca_obj=lca_obj, workers=workers, seed=seed
+    )
+    return session.view(max_level=max_level, cutoff=cutoff, max_nodes=max_nodes, importance_first=importance_first)
+
+
+class SankeySession:
+    """
+    Supply chain graph of an activity that is traversed on demand, to look at it with several cutoffs and levels.
+
+    The LCA is solved once, when the session is created. Every node expanded by a ``view`` is kept: coarser views
+    only prune the stored tree, finer or deeper views only expand the nodes cut off before. With Monte Carlo
+    simulation, the iterations are drawn once for all products, by the first view.
+
+    Parameters
+    ----------
+    activity: Activity
+        Starting point of the supply chain graph.
+    lcia_method: tuple
+        LCIA method to use when traversing supply chain graph.
+    amount: int
+        Amount of activity to assess.
+    mc: bool
+        wether Monte Carlo simulation should carry out or not.
+    mc_number: int
+        Iterations of the monte carlo simulations.
+    lca_obj: LCA
+        LCA object with ``lcia`` done for ``lcia_method``, built for ``activity`` if not given.
+    workers: int
+        Number of processes drawing the Monte Carlo iterations.
+    seed: int
+        Seed of the Monte Carlo simulation, random if None.
+    """
+
+    def __init__(self, activity, lcia_method, amount=1, mc=False, mc_number=100, lca_obj=None, workers=1, seed=None):
+        self.activity = get_activity(activity)
+        self.lcia_method = lcia_method
+        self.amount = amount
+        self.mc = mc
+        self.mc_number = mc_number
+        self.workers = workers
+        self.seed = seed
+        if lca_obj is None:
+            lca_obj = bc.LCA({self.activity: amount}, lcia_method)
+            lca_obj.lci()
+            lca_obj.lcia()
+
+        self.technosphere = lca_obj.technosphere_matrix.tocsc(copy=True)
+        self.technosphere.sum_duplicates()
+        characterized_biosphere = np.asarray(
+            (lca_obj.characterization_matrix @ lca_obj.biosphere_matrix).sum(axis=0)
+        ).ravel()
+        self.unit_scores = bc.spsolve(self.technosphere.T.tocsc(), characterized_biosphere)
+
+        # product row <-> activity column, -1 for products without an activity column
+        self.product_ids = np.array([lca_obj.dicts.product.reversed[row] for row in range(self.technosphere.shape[0])])
+        self.column_of_row = np.array(
+            [lca_obj.dicts.activity.get(product_id, -1) for product_id in self.product_ids.tolist()]
+        )
+        self.root_row = lca_obj.dicts.product[self.activity.id]
+        self.total_score = amount * self.unit_scores[self.root_row]
+
+        # traversed tree in growable arrays, the root link is node 0. The children of a node are the block of
+        # n_children nodes starting at first_child, which is -1 until the node is expanded.
+        self._size = 0
+        self._rows = np.empty(0, dtype=int)
+        self._amounts = np.empty(0)
+        self._scores = np.empty(0)
+        self._levels = np.empty(0, dtype=int)
+        self._first_child = np.empty(0, dtype=int)
+        self._n_children = np.empty(0, dtype=int)
+        self._append([self.root_row], [amount], [self.total_score], 0)
+        self._activities = {}
+        # inputs of each product, shared by all the nodes of the product
+        self._structure = {}
+        self._unit_samples = None
+
+    def _append(self, rows, amounts, scores, level):
+        """Append a block of nodes of the same level to the tree, growing its arrays geometrically."""
+        start, end = self._size, self._size + len(rows)
+        if end > len(self._rows):
+            capacity = max(end, 2 * len(self._rows))
+            for name in ('_rows', '_amounts', '_scores', '_levels', '_first_child', '_n_children'):
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:start] = array[:start]
+                setattr(self, name, grown)
+        self._rows[start:end] = rows
+        self._amounts[start:end] = amounts
+        self._scores[start:end] = scores
+        self._levels[start:end] = level
+        self._first_child[start:end] = -1
+        self._n_children[start:end] = 0
+        self._size = end
+        return start
+
+    def _inputs(self, row):
+        """Input rows, input amounts, production amount and unit scores of the inputs of a product, read once."""
+        if row not in self._structure:
+            column = self.column_of_row[row]
+            start, end = self.technosphere.indptr[column], self.technosphere.indptr[column + 1]
+            rows = self.technosphere.indices[start:end]
+            values = self.technosphere.data[start:end]
+            is_production = rows == row
+            prod_amount = values[is_production].sum() if is_production.any() else 1
+            child_rows = rows[~is_production]
+            self._structure[row] = (child_rows, -values[~is_production], prod_amount, self.unit_scores[child_rows])
+        return self._structure[row]
+
+    def _expand(self, node):
+        """Append the children of a node to the tree, in the order of the exchanges."""
+        child_rows, input_amounts, prod_amount, child_unit_scores = self._inputs(self._rows[node])
+        child_amounts = self._amounts[node] * input_amounts / prod_amount
+        self._first_child[node] = self._append(
+            child_rows, child_amounts, child_amounts * child_unit_scores, self._levels[node] + 1
+        )
+        self._n_children[node] = len(child_rows)
+
+    def _children(self, node, max_level, threshold):
+        """Children of a node if it is traversed deeper than ``max_level`` and ``threshold``, expanded if needed."""
+        if (self._levels[node] >= max_level or abs(self._scores[node]) <= threshold
+                or self.column_of_row[self._rows[node]] == -1):
+            return range(0)
+        if self._first_child[node] == -1:
+            self._expand(node)
+        first_child = self._first_child[node]
+        return range(first_child, first_child + self._n_children[node])
+
+    def _select_important(self, max_level, threshold, max_nodes):
+        """Nodes of the ``max_nodes`` links with the highest absolute scores, expanded from a heap of the children."""
+        selected = set()
+        heap = [(-abs(self._scores[0]), 0)]
+        while heap:
+            if max_nodes is not None and len(selected) >= max_nodes:
+                warn("Stopping traversal due to node count.")
+                break
+            _, node = heappop(heap)
+            selected.add(node)
+            for child in self._children(node, max_level, threshold):
+                heappush(heap, (-abs(self._scores[child]), child))
+        return selected
+
+    def view(self, max_level=3, cutoff=1e-2, max_nodes=None, importance_first=False):
+        """
+        Supply chain graph down to ``max_level`` and ``cutoff``, expanding the tree where needed.
+
+        Parameters
+        ----------
+        max_level: int
+            Maximum depth to traverse.
+        cutoff: float
+            Fraction of total score to use as cutoff when deciding whether to traverse deeper and
+            if Monte Carlo simulation should be carried out.
+        max_nodes: int
+            Maximum number of links of the graph. The traversal stops with a warning when it is reached, no limit
+            if None.
+        importance_first: bool
+            Spend ``max_nodes`` on the links with the highest absolute scores, wherever they are in the graph,
+            instead of the first links in the order of the exchanges. The links are numbered in the same order
+            either way, and without ``max_nodes`` the graph is the same.
+
+        Returns
+        -------
+        dict
+            Same dictionary as ``recursive_calculation_to_plotly``.
+        """
+        threshold = abs(self.total_score * cutoff)
+        selected = self._select_important(max_level, threshold, max_nodes) if importance_first else None
+        target, tree_nodes = [], []
+        # depth-first, so that nodes are numbered in the same order as the recursion
+        stack = [(0, 0)]
+        while stack:
+            if selected is None and max_nodes is not None and len(tree_nodes) >= max_nodes:
+                warn("Stopping traversal due to node count.")
+                break
+            parent_node, node = stack.pop()
+            tree_nodes.append(node)
+            target.append(parent_node)
+            for child in reversed(self._children(node, max_level, threshold)):
+                if selected is None or child in selected:
+                    stack.append((len(tree_nodes), child))
+
+        tree_nodes = np.array(tree_nodes, dtype=int)
+        source = list(range(1, len(tree_nodes) + 1))
+        scores = self._scores[tree_nodes].tolist()
+        link_rows = self._rows[tree_nodes]
+        is_mc = np.zeros(len(scores), dtype=bool)
+        samples = np.empty((len(scores), self.mc_number if self.mc else 0))
+        if self.mc:
+            if self._unit_samples is None:
+                self._unit_samples = parallel_sample_unit_scores(
+                    {self.activity.id: self.amount}, self.lcia_method, self.product_ids.tolist(), self.mc_number,
+                    workers=self.workers, seed=self.seed,
+                )
+            # samples of the unit score of each link, scaled by its amount
+            samples[:] = self._unit_samples[:, link_rows].T * self._amounts[tree_nodes][:, None]
+            mc_total_score = np.median(samples[0])
+            is_mc = np.abs(scores) > abs(mc_total_score * cutoff)
+            is_mc[0] = True
+            samples[~is_mc] = np.array(scores)[~is_mc, None]
+            scores = np.where(is_mc, samples.mean(axis=1), scores).tolist()
+
+        node_ids = self.product_ids[np.concatenate(([self.root_row], link_rows))].tolist()
+        self._activities.update(get_activities(set(node_ids) - self._activities.keys()))
+        nodes = {
+            node: {"act": self._activities[act_id],
+                   'name': f"{self._activities[act_id]['name']}, {self._activities[act_id]['location']}"}
+            for node, act_id in enumerate(node_ids)
+        }
+        return {'targets': target, 'sources': source, 'scores': scores, 'samples': samples, 'mc_mask': is_mc,
+                'nodes': nodes}
+
+    def plot(self, max_level=3, cutoff=1e-2, max_nodes=None, importance_first=False, **kwargs):
+        """
+        Sankey figure of ``view``.
+
+        Parameters
+        ----------
+        max_level: int
+            Maximum depth to traverse.
+        cutoff: float
+            Fraction of total score to use as cutoff when deciding whether to traverse deeper.
+        max_nodes: int
+            Maximum number of links of the graph, no limit if None.
+        importance_first: bool
+            Spend ``max_nodes`` on the links with the highest absolute scores (see ``view``).
+        **kwargs
+            Arguments of ``generate_sankey``, e.g. ``type`` and its own ``cutoff`` for bundling links as
+            ``sankey_cutoff``.
+
+        Returns
+        -------
+        Figure
+            Sankey figure.
+        """
+        from .sankertainpy import generate_sankey
+
+        if 'sankey_cutoff' in kwargs:
+            kwargs['cutoff'] = kwargs.pop('sankey_cutoff')
+        data = self.view(max_level=max_level, cutoff=cutoff, max_nodes=max_nodes, importance_first=importance_first)
+        return generate_sankey(data, **kwargs)
+
+
+def cached_calculation_to_plotly(
+        activity,
+        lcia_method,
+        amount=1,
+        max_level=3,
+        cutoff=1e-2,
+        mc=False,
+        mc_number=100,
+        use_cache=True,
+        max_nodes=None,
+        importance_first=False,
+):
+    """
+    Run ``recursive_calculation_to_plotly``, reusing the result stored in the traversal cache of the project if the
+    activity, method, parameters and databases did not change. Cached Monte Carlo results are returned as drawn
+    the first time.
+
+    Parameters
+    ----------
+    activity: Activity
+        Starting point of the supply chain graph.
+    lcia_method: tuple
+        LCIA method to use when traversing supply chain graph.
+    amount: int
+        Amount of activity to assess.
+    max_level: int
+        Maximum depth to traverse.
+    cutoff: float
+        Fraction of total score to use as cutoff when deciding whether to traverse deeper and
+        if Monte Carlo simulation should be carried out.
+    mc: bool
+        wether Monte Carlo simulation should carry out or not.
+    mc_number: int
+        Iterations of the monte carlo simulations.
+    use_cache: bool
+        Read and write the traversal cache.
+    max_nodes: int
+        Maximum number of links of the graph, no limit if None.
+    importance_first: bool
+        Spend ``max_nodes`` on the links with the highest absolute scores (see ``SankeySession.view``).
+
+    Returns
+    -------
+    dict
+        Same dictionary as ``recursive_calculation_to_plotly``.
+    """
+    activity = get_activity(activity)
+    key = traversal_key(
+        "sankertainpy", {activity: amount}, lcia_method, max_level=max_level, cutoff=cutoff, mc=mc, mc_number=mc_number,
+        max_nodes=max_nodes, importance_first=importance_first,
+    )
+    cached = load_traversal(key) if use_cache else None
+    if cached is not None:
+        arrays, metadata = cached
+        node_ids = arrays["node_activity"].tolist()
+        activities = get_activities(node_ids)
+        nodes = {
+            node: {"act": activities[act_id], "name": name}
+            for node, act_id, name in zip(arrays["node_index"].tolist(), node_ids, arrays["node_name"].tolist())
+        }
+        return {
+            'targets': arrays["targets"].tolist(),
+            'sources': arrays["sources"].tolist(),
+            'scores': arrays["scores"].tolist(),
+            'samples': arrays["samples"],
+            'mc_mask': arrays["mc_mask"],
+            'nodes': nodes,
+        }
+
+    result = recursive_calculation_to_plotly(
+        activity, lcia_method, amount=amount, max_level=max_level, cutoff=cutoff, mc=mc, mc_number=mc_number,
+        max_nodes=max_nodes, importance_first=importance_first,
+    )
+    if use_cache and result is not None:
+        arrays = {
+            "targets": np.array(result['targets'], dtype=int),
+            "sources": np.array(result['sources'], dtype=int),
+            "node_index": np.fromiter(result['nodes'], dtype=int, count=len(result['nodes'])),
+            "node_activity": np.array([node["act"].id for node in result['nodes'].values()], dtype=int),
+            "node_name": np.array([node["name"] for node in result['nodes'].values()], dtype=str),
+            "scores": np.array(result['scores'], dtype=float),
+            "samples": result['samples'],
+            "mc_mask": result['mc_mask'],
+        }
+        save_traversal(key, arrays, {})
+    return result
@@ -1,4 +1,7 @@
+import importlib
 import importlib.metadata
+import importlib.util
+import sys
 from typing import Union
 
 
@@ -15,3 +18,105 @@ def get_version_tuple() -> tuple:
         .strip()
         .split(".")
     )
+
+
+def lazy_import(name: str):
+    """
+    Import a module whose code is only executed on first attribute access.
+
+    Used for the plotting and notebook dependencies, so that importing a module of this package does not load them
+    until a function actually needs them. The parent packages of a dotted ``name`` are imported right away.
+
+    Parameters
+    ----------
+    name : str
+        Absolute name of the module.
+
+    Returns
+    -------
+    module
+        The (not yet executed) module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def lazy_getattr(module_name: str, exports: dict):
+    """
+    Build a module level ``__getattr__`` importing the exports of a package on first access.
+
+    Parameters
+    ----------
+    module_name : str
+        ``__name__`` of the package.
+    exports : dict
+        Export name to ``(submodule, attribute)``. An attribute of None exports the submodule itself.
+
+    Returns
+    -------
+    callable
+        The ``__getattr__`` function of the package.
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module '{module_name}' has no attribute '{name}'")
+        submodule, attribute = exports[name]
+        value = importlib.import_module(submodule, module_name)
+        if attribute is not None:
+            value = getattr(value, attribute)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    return __getattr__
+
+
+def project_location() -> tuple:
+    """
+    Locate the current Brightway project, to activate it again in another process with ``activate_project``.
+
+    Returns
+    -------
+    tuple
+        Name of the project, and base data and logs directories of the projects.
+    """
+    from bw2data import projects
+
+    return projects.current, projects.dir.parent, projects.logs_dir.parent
+
+
+def activate_project(name: str, base_dir, base_logs_dir):
+    """
+    Activate a Brightway project located by ``project_location``, e.g. in a spawned worker process.
+
+    The base directories are set first, so that projects outside of the default directory, e.g. of ``bw2test``, are
+    found. Unlike ``projects.set_current``, a missing project is not created.
+
+    Parameters
+    ----------
+    name : str
+        Name of the project.
+    base_dir : pathlib.Path
+        Base data directory of the projects.
+    base_logs_dir : pathlib.Path
+        Base logs directory of the projects.
+
+    Raises
+    ------
+    ValueError
+        If the project does not exist in ``base_dir``.
+    """
+    from bw2data import projects
+
+    projects.db.change_path(base_dir / "projects.db")
+    if name not in projects:
+        raise ValueError(f"Brightway project '{name}' not found in {base_dir}")
+    projects.change_base_directories(base_dir, base_logs_dir, project_name=name, update=False)
@@ -1,16 +1,146 @@
+import bw2analyzer as ba
+import bw2calc as bc
+import bw2data as bd
+import matplotlib.pyplot as plt
+import numpy as np
 import pytest
 
+from bw_visualization.compare_plot.compare_plot import lca_report
+from bw_visualization.compare_plot.report import Report
 from bw_visualization.compare_plot.utils import (
+    ResultStore,
+    activity_names,
+    lca_scores,
     lca_comparison,
     act_topscore,
     contributions_df,
+    contributions_dfs,
+    top_contributors,
 )
 
-from .utils import sample_1
+from .utils import sample_1, foreground_fu
 
 FU, METHODS, METHOD_REF = sample_1()
 
 
+@pytest.fixture(scope="module")
+def fu_multi():
+    """Functional unit with an activity of a second database, deleted after the tests of this module"""
+    fu = foreground_fu(FU, database="foreground")
+    yield fu
+    del bd.databases["foreground"]
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'expected'),
+    [
+        (FU, METHODS, len(FU)),
+    ]
+)
+def test_result_store_success(fu, methods, expected):
+    store = ResultStore()
+    lca_comparison(fu, methods, store=store)
+    act_topscore(fu, methods[0], store=store)
+    contributions_df(list(fu.keys())[0], methods[0], store=store)
+    assert expected == store.solves
+    assert store.requests - expected == store.saved
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'expected'),
+    [
+        (FU, METHODS, len(FU) * (len(METHODS) + 1)),
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_result_store_fail(fu, methods, expected):
+    store = ResultStore()
+    lca_comparison(fu, methods, store=store)
+    act_topscore(fu, methods[0], store=store)
+    assert expected == store.solves
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'expected'),
+    [
+        (FU, METHODS, (len(FU), len(METHODS))),
+    ]
+)
+def test_lca_scores_success(fu, methods, expected):
+    result = lca_scores(fu, methods)
+    act, q = list(fu.items())[-1]
+    lca = bc.LCA({act: q}, methods[-1])
+    lca.lci()
+    lca.lcia()
+    assert expected == result.shape
+    assert result[-1, -1] == pytest.approx(lca.score)
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'expected'),
+    [
+        (FU, METHODS, (len(METHODS), len(FU)))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_lca_scores_fail(fu, methods, expected):
+    result = lca_scores(fu, methods)
+    assert expected == result.shape
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'n_jobs'),
+    [
+        (FU, METHODS, 2)
+    ]
+)
+def test_lca_scores_n_jobs_success(fu, methods, n_jobs):
+    result = lca_scores(fu, methods, n_jobs=n_jobs)
+    assert result == pytest.approx(lca_scores(fu, methods))
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'n_jobs'),
+    [
+        (FU, METHODS, 0)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_lca_scores_n_jobs_fail(fu, methods, n_jobs):
+    result = lca_scores(fu, methods, n_jobs=n_jobs)
+    assert result == pytest.approx(lca_scores(fu, methods))
+
+
+@pytest.mark.parametrize(
+    ('methods', 'n_jobs'),
+    [
+        (METHODS, 2)
+    ]
+)
+def test_result_store_fetch_success(fu_multi, methods, n_jobs):
+    store = ResultStore()
+    store.fetch(fu_multi, methods, n_jobs=n_jobs)
+    solves = store.solves
+    result = lca_scores(fu_multi, methods, store=store)
+
+    assert len(fu_multi) == solves == store.solves
+    assert result == pytest.approx(lca_scores(fu_multi, methods))
+
+
+@pytest.mark.parametrize(
+    ('methods', 'n_jobs'),
+    [
+        (METHODS, 2)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_result_store_fetch_fail(fu_multi, methods, n_jobs):
+    store = ResultStore()
+    store.fetch(fu_multi, methods, n_jobs=n_jobs)
+
+    assert 0 == store.solves
+
+
 @pytest.mark.parametrize(
     ('fu', 'methods', 'method_ref', 'expected'),
     [
@@ -78,3 +208,144 @@ def test_contributions_df_success(activity, method, expected):
 def test_contributions_df_fail(activity, method, expected):
     result = contributions_df(activity, method)
     assert expected == list(result.to_dict().keys())[0]
+
+
+@pytest.mark.parametrize(
+    ('contributions', 'limit', 'limit_type', 'expected'),
+    [
+        (np.array([[1., 0.], [-3., 2.], [0.5, 2.], [2., -5.]]), 0.2, 'percent', [[1, 3], [3, 1, 2]]),
+        (np.array([[1., 0.], [-3., 2.], [0.5, 2.], [2., -5.]]), 2, 'number', [[1, 3], [3, 1]]),
+    ]
+)
+def test_top_contributors_success(contributions, limit, limit_type, expected):
+    result = top_contributors(contributions, limit=limit, limit_type=limit_type)
+    assert expected == [rows.tolist() for rows in result]
+
+
+@pytest.mark.parametrize(
+    ('contributions', 'limit', 'limit_type', 'expected'),
+    [
+        (np.array([[1., 0.], [-3., 2.], [0.5, 2.], [2., -5.]]), 2, 'number', [[3, 1], [3, 2]]),
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_top_contributors_fail(contributions, limit, limit_type, expected):
+    result = top_contributors(contributions, limit=limit, limit_type=limit_type)
+    assert expected == [rows.tolist() for rows in result]
+
+
+def top_processes(activity, method, limit):
+    lca = bc.LCA({activity: 1}, method)
+    lca.lci()
+    lca.lcia()
+    top = ba.ContributionAnalysis().annotated_top_processes(lca, names=False, limit=limit, limit_type='percent')
+    return {i: score for score, _, i in top}
+
+
+@pytest.mark.parametrize(
+    ('position', 'methods', 'limit'),
+    [
+        (0, METHODS, 0.01),
+        (-1, METHODS, 0.01),
+    ]
+)
+def test_contributions_dfs_success(fu_multi, position, methods, limit):
+    # the activities of FU, then the one of the second database
+    activity = list(fu_multi.keys())[position]
+    result = contributions_dfs(activity, methods, limit=limit, index='id')
+    assert methods == list(result.keys())
+    for m in methods:
+        assert top_processes(activity, m, limit) == pytest.approx(result[m][m].to_dict())
+
+
+@pytest.mark.parametrize(
+    ('activity', 'methods', 'limit'),
+    [
+        (list(FU.keys())[0], METHODS, 0.01)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_contributions_dfs_fail(activity, methods, limit):
+    result = contributions_dfs(activity, methods, limit=limit)
+    for m in methods:
+        assert top_processes(activity, m, limit) == pytest.approx(result[m][m].to_dict())
+
+
+@pytest.mark.parametrize(
+    ('position', 'method'),
+    [
+        (-1, METHOD_REF)
+    ]
+)
+def test_activity_names_success(fu_multi, position, method):
+    activity = list(fu_multi.keys())[position]
+    ids = contributions_df(activity, method, index='id').index
+    assert {i: bd.get_node(id=i)['name'] for i in ids} == activity_names(ids)
+
+
+@pytest.mark.parametrize(
+    ('position', 'method'),
+    [
+        (-1, METHOD_REF)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_activity_names_fail(fu_multi, position, method):
+    activity = list(fu_multi.keys())[position]
+    codes = contributions_df(activity, method).index
+    assert {c: bd.get_node(code=c)['name'] for c in codes} == activity_names(codes)
+
+
+@pytest.mark.parametrize(
+    ('filename', 'expected'),
+    [
+        ('report.html', 2),
+        ('report.pdf', 2),
+    ]
+)
+def test_report_success(tmp_path, filename, expected):
+    with Report(tmp_path / filename) as report:
+        for _ in range(expected):
+            fig, axes = plt.subplots()
+            axes.plot([0, 1], [1, 0])
+            report.figure(fig)
+    assert expected == report.figures
+    assert (tmp_path / filename).stat().st_size > 0
+    assert not plt.get_fignums()
+
+
+@pytest.mark.parametrize(
+    ('filename', 'expected'),
+    [
+        ('report.png', 1),
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_report_fail(tmp_path, filename, expected):
+    with Report(tmp_path / filename) as report:
+        report.figure(plt.subplots()[0])
+    assert expected == report.figures
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'filename'),
+    [
+        (FU, METHODS, 'report.html'),
+    ]
+)
+def test_lca_report_success(tmp_path, fu, methods, filename):
+    report = lca_report(tmp_path / filename, fu, methods)
+    assert report.figures > 0
+    assert (tmp_path / filename).read_text(encoding='utf-8').count('<img') == report.figures
+
+
+@pytest.mark.parametrize(
+    ('fu', 'methods', 'filename'),
+    [
+        (FU, METHODS, 'report.txt'),
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_lca_report_fail(tmp_path, fu, methods, filename):
+    report = lca_report(tmp_path / filename, fu, methods)
+    assert report.figures > 0
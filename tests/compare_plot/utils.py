@@ -14,3 +14,22 @@ def sample_1():
     impact_categories = [methods[0], methods[3], methods[4], methods[6]]
 
     return fu, impact_categories, impact_categories[0]
+
+
+def foreground_fu(fu, database="foreground"):
+    """Add to a functional unit an activity of a second database, supplied by the activities of ``fu``.
+
+    The database is written in the current project, delete it once done.
+    """
+    if database not in bd.databases:
+        bd.Database(database).write({
+            (database, "assembly"): {
+                "name": "Assembly of the compared products",
+                "unit": "unit",
+                "location": "GLO",
+                "exchanges": [{"input": (database, "assembly"), "amount": 1, "type": "production"}] + [
+                    {"input": act.key, "amount": 0.5, "type": "technosphere"} for act in fu
+                ],
+            },
+        })
+    return {**fu, bd.get_node(database=database, code="assembly"): 1}
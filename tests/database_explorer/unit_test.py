@@ -1,18 +1,31 @@
 import pytest
 import numpy as np
+import pandas as pd
+import bw2data as bd
+from bw2calc import spsolve
 
 from bw_visualization.database_explorer.utils import (
+    EDGE_COLUMNS,
     JRCAssumedDiagonalGraphTraversal,
+    column_solver,
+    factorize,
+    separate_multiple_parent,
+    get_activities_metadata,
+    traversal_to_arrays,
+    traversal_from_arrays,
 )
 from bw_visualization.database_explorer.database_explorer import (
     ListAct,
 )
 
+from .utils import sample_2, sample_3
 # from .utils import sample_1
 
 
 # LCA, ACT, METHODS_EF, METHODS_CC, DB = sample_1()
 LCA, ACT, METHODS_EF, METHODS_CC, DB = None, {'name': None, 'unit': None, 'location': None}, {}, {}, None
+LCA_CHAIN = sample_2()
+USEEIO_DB = sample_3()
 
 
 @pytest.mark.skip(reason="Cant be tested until database_explorer is ready!")
@@ -27,6 +40,8 @@ def test_calculate_success(lca, expected):
     assert result.get('counter') is not None
     assert result.get('edges') is not None
     assert result.get('nodes') is not None
+    assert result.get('cache_hits') is not None
+    assert result.get('cache_misses') is not None
 
 
 @pytest.mark.skip(reason="Cant be tested until database_explorer is ready!")
@@ -44,6 +59,76 @@ def test_calculate_fail(lca, expected):
     assert result.get('nodes') is None
 
 
+CHAIN_EDGES = {
+    'path_id': [0, 1, 2, 3],
+    'parent_path_id': [-1, 0, 0, 1],
+    'activity': [0, 1, 2, 2],
+    'depth': [1, 2, 2, 3],
+    'amount': [1.0, 0.5, 2.0, 0.5],
+    'exc_amount': [1.0, 0.5, 2.0, 1.0],
+    'impact': [9.5, 2.5, 6.0, 1.5],
+    'impact_neg': [0.0, 0.0, 0.0, 0.0],
+    'impact_pos': [9.5, 2.5, 6.0, 1.5],
+}
+
+
+@pytest.mark.parametrize(
+    ('lca', 'cutoff', 'expected'),
+    [
+        (LCA_CHAIN, 0, CHAIN_EDGES)
+    ]
+)
+def test_calculate_edges_success(lca, cutoff, expected):
+    edges = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff)['edges']
+    assert list(EDGE_COLUMNS) == list(edges)
+    for column, dtype in EDGE_COLUMNS.items():
+        assert (len(expected['path_id']),) == edges[column].shape
+        assert np.issubdtype(edges[column].dtype, dtype)
+        assert expected[column] == pytest.approx(edges[column].tolist())
+    # every other edge continues the path of an edge into its parent activity, which consumes its activity
+    children = edges['parent_path_id'] != -1
+    parents = edges['parent_path_id'][children]
+    assert np.array_equal(edges['path_id'], np.arange(len(expected['path_id'])))
+    assert np.array_equal(edges['depth'][parents] + 1, edges['depth'][children])
+    assert (lca.technosphere_matrix[edges['activity'][children], edges['activity'][parents]] < 0).all()
+
+
+@pytest.mark.parametrize(
+    ('lca', 'cutoff', 'expected'),
+    [
+        (LCA_CHAIN, 0.5, CHAIN_EDGES)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_calculate_edges_fail(lca, cutoff, expected):
+    edges = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff)['edges']
+    assert (len(expected['path_id']),) == edges['path_id'].shape
+
+
+@pytest.mark.parametrize(
+    ('lca', 'adjoint', 'expected'),
+    [
+        (LCA_CHAIN, False, (1, 3, 0)),
+        (LCA_CHAIN, True, (1, 0, 3)),
+    ]
+)
+def test_calculate_cache_counters_success(lca, adjoint, expected):
+    result = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0, adjoint=adjoint)
+    assert expected == (result['cache_hits'], result['cache_misses'], result['adjoint_lookups'])
+
+
+@pytest.mark.parametrize(
+    ('lca', 'adjoint', 'expected'),
+    [
+        (LCA_CHAIN, True, (1, 3, 0))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_calculate_cache_counters_fail(lca, adjoint, expected):
+    result = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0, adjoint=adjoint)
+    assert expected == (result['cache_hits'], result['cache_misses'], result['adjoint_lookups'])
+
+
 @pytest.mark.skip(reason="Cant be tested until database_explorer is ready!")
 @pytest.mark.parametrize(
     ('lca', 'expected'),
@@ -142,6 +227,205 @@ def test_cumulative_score_fail(lca, expected):
     assert result[2] is None
 
 
+@pytest.mark.parametrize(
+    ('lca', 'expected'),
+    [
+        (LCA_CHAIN, None)
+    ]
+)
+def test_cumulative_score_factorized_success(lca, expected):
+    supply = lca.supply_array.copy()
+    characterized_biosphere = np.array(
+        (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    characterized_biosphere_neg = characterized_biosphere.copy()
+    characterized_biosphere_neg[characterized_biosphere_neg > 0] = 0
+    characterized_biosphere_pos = characterized_biosphere.copy()
+    characterized_biosphere_pos[characterized_biosphere_pos < 0] = 0
+    solver = factorize(lca.technosphere_matrix)
+    for index in range(supply.shape[0]):
+        expected = JRCAssumedDiagonalGraphTraversal().cumulative_score(index, supply, characterized_biosphere,
+                                                                       characterized_biosphere_neg,
+                                                                       characterized_biosphere_pos, lca)
+        result = JRCAssumedDiagonalGraphTraversal().cumulative_score(index, supply, characterized_biosphere,
+                                                                     characterized_biosphere_neg,
+                                                                     characterized_biosphere_pos, lca, solver)
+        assert np.allclose(result, expected)
+
+
+@pytest.mark.parametrize(
+    ('lca', 'expected'),
+    [
+        (LCA_CHAIN, None)
+    ]
+)
+def test_cumulative_scores_success(lca, expected):
+    supply = lca.supply_array.copy()
+    characterized_biosphere = np.array(
+        (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    characterized_biosphere_neg = characterized_biosphere.copy()
+    characterized_biosphere_neg[characterized_biosphere_neg > 0] = 0
+    characterized_biosphere_pos = characterized_biosphere.copy()
+    characterized_biosphere_pos[characterized_biosphere_pos < 0] = 0
+    solver = factorize(lca.technosphere_matrix)
+    result = JRCAssumedDiagonalGraphTraversal().cumulative_scores([0, 1, 2], supply, characterized_biosphere,
+                                                                  characterized_biosphere_neg,
+                                                                  characterized_biosphere_pos, lca, solver)
+    assert result.shape == (3, 3)
+    for column, index in enumerate([0, 1, 2]):
+        expected = JRCAssumedDiagonalGraphTraversal().cumulative_score(index, supply, characterized_biosphere,
+                                                                       characterized_biosphere_neg,
+                                                                       characterized_biosphere_pos, lca)
+        assert np.allclose(result[:, column], expected)
+
+
+def vector_solver(matrix):
+    """Solver of one right-hand side vector at a time, like the umfpack ``solve`` of ``bw2calc.factorized``"""
+    def solve(rhs):
+        if rhs.ndim != 1:
+            raise ValueError("Only right-hand side vectors are supported")
+        return spsolve(matrix, rhs)
+
+    return solve
+
+
+@pytest.mark.parametrize(
+    ('lca', 'indices'),
+    [
+        (LCA_CHAIN, [0, 1, 2]),
+        (LCA_CHAIN, [2]),
+    ]
+)
+def test_column_solver_success(lca, indices):
+    supply = lca.supply_array.copy()
+    characterized_biosphere = np.array(
+        (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    characterized_biosphere_neg = characterized_biosphere.copy()
+    characterized_biosphere_neg[characterized_biosphere_neg > 0] = 0
+    characterized_biosphere_pos = characterized_biosphere.copy()
+    characterized_biosphere_pos[characterized_biosphere_pos < 0] = 0
+    solver = column_solver(vector_solver(lca.technosphere_matrix))
+    result = JRCAssumedDiagonalGraphTraversal().cumulative_scores(indices, supply, characterized_biosphere,
+                                                                  characterized_biosphere_neg,
+                                                                  characterized_biosphere_pos, lca, solver)
+    expected = JRCAssumedDiagonalGraphTraversal().cumulative_scores(indices, supply, characterized_biosphere,
+                                                                    characterized_biosphere_neg,
+                                                                    characterized_biosphere_pos, lca,
+                                                                    factorize(lca.technosphere_matrix))
+    assert np.allclose(result, expected)
+
+
+@pytest.mark.parametrize(
+    ('lca', 'indices'),
+    [
+        (LCA_CHAIN, [0, 1, 2])
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_column_solver_fail(lca, indices):
+    supply = lca.supply_array.copy()
+    characterized_biosphere = np.array(
+        (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    solver = vector_solver(lca.technosphere_matrix)
+    JRCAssumedDiagonalGraphTraversal().cumulative_scores(indices, supply, characterized_biosphere,
+                                                         characterized_biosphere, characterized_biosphere, lca,
+                                                         solver)
+
+
+@pytest.mark.parametrize(
+    ('lca', 'batch_size'),
+    [
+        (LCA_CHAIN, 1),
+        (LCA_CHAIN, 2),
+        (LCA_CHAIN, 3),
+    ]
+)
+def test_calculate_batch_size_success(lca, batch_size):
+    expected = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0)
+    result = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0, batch_size=batch_size)
+    assert expected['counter'] == result['counter']
+    assert expected['nodes'].keys() == result['nodes'].keys()
+    for index, node in expected['nodes'].items():
+        assert node == pytest.approx(result['nodes'][index])
+    for column, values in expected['edges'].items():
+        assert np.allclose(values, result['edges'][column])
+
+
+@pytest.mark.parametrize(
+    ('lca', 'batch_size'),
+    [
+        (LCA_CHAIN, 0)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_calculate_batch_size_fail(lca, batch_size):
+    JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0, batch_size=batch_size)
+
+
+@pytest.mark.parametrize(
+    ('lca', 'expected'),
+    [
+        (LCA_CHAIN, None)
+    ]
+)
+def test_unit_cumulative_scores_success(lca, expected):
+    supply = lca.supply_array.copy()
+    characterized_biosphere = np.array(
+        (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    characterized_biosphere_neg = characterized_biosphere.copy()
+    characterized_biosphere_neg[characterized_biosphere_neg > 0] = 0
+    characterized_biosphere_pos = characterized_biosphere.copy()
+    characterized_biosphere_pos[characterized_biosphere_pos < 0] = 0
+    unit_scores = JRCAssumedDiagonalGraphTraversal().unit_cumulative_scores(lca, characterized_biosphere,
+                                                                            characterized_biosphere_neg,
+                                                                            characterized_biosphere_pos)
+    assert unit_scores.shape == (3, supply.shape[0])
+    for index in range(supply.shape[0]):
+        result = JRCAssumedDiagonalGraphTraversal().cumulative_score(index, supply, characterized_biosphere,
+                                                                     characterized_biosphere_neg,
+                                                                     characterized_biosphere_pos, lca,
+                                                                     unit_scores=unit_scores)
+        expected = JRCAssumedDiagonalGraphTraversal().cumulative_score(index, supply, characterized_biosphere,
+                                                                       characterized_biosphere_neg,
+                                                                       characterized_biosphere_pos, lca)
+        assert np.allclose(result, expected)
+
+
+@pytest.mark.parametrize(
+    ('lca', 'cutoff'),
+    [
+        (LCA_CHAIN, 0),
+        (LCA_CHAIN, 0.5),
+    ]
+)
+def test_calculate_adjoint_success(lca, cutoff):
+    expected = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff)
+    result = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff, adjoint=True)
+    assert expected['counter'] == result['counter']
+    assert expected['nodes'].keys() == result['nodes'].keys()
+    for index, node in expected['nodes'].items():
+        assert node == pytest.approx(result['nodes'][index])
+    for column, values in expected['edges'].items():
+        assert np.allclose(values, result['edges'][column])
+
+
+@pytest.mark.parametrize(
+    ('lca', 'cutoff'),
+    [
+        (LCA_CHAIN, 0.5)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_calculate_adjoint_fail(lca, cutoff):
+    expected = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=0)
+    result = JRCAssumedDiagonalGraphTraversal().calculate(lca, cutoff=cutoff, adjoint=True)
+    assert expected['nodes'].keys() == result['nodes'].keys()
+
+
 @pytest.mark.skip(reason="Cant be tested until database_explorer is ready!")
 @pytest.mark.parametrize(
     ('lca', 'expected'),
@@ -228,6 +512,123 @@ def test_traverse_fail(lca, expected):
     assert result[2] is None
 
 
+@pytest.mark.parametrize(
+    ('db', 'count', 'chunk_size'),
+    [
+        (USEEIO_DB, 10, 3),
+        (USEEIO_DB, 10, 500),
+    ]
+)
+def test_get_activities_metadata_success(db, count, chunk_size):
+    ids = [act.id for act in list(db)[:count]]
+    result = get_activities_metadata(ids, chunk_size=chunk_size)
+    expected = {}
+    for i in ids:
+        act = bd.get_node(id=i)
+        expected[i] = {'name': act['name'], 'location': act['location'], 'unit': act['unit'], 'code': act['code']}
+    assert expected == result
+
+
+@pytest.mark.parametrize(
+    ('db', 'count', 'chunk_size'),
+    [
+        (USEEIO_DB, 10, 3)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_get_activities_metadata_fail(db, count, chunk_size):
+    ids = [act.id for act in list(db)[:count]]
+    result = get_activities_metadata(ids[:chunk_size], chunk_size=chunk_size)
+    assert count == len(result)
+
+
+SEPARATE_DF = pd.DataFrame({
+    'path_id': [0, 1, 2, 3, 4, 5, 6],
+    'parent_path_id': [-1, 0, 0, 1, 2, 3, 4],
+    'act_id': [0, 1, 2, 3, 3, 4, 4],
+    'depth': [1, 2, 2, 3, 3, 4, 4],
+    'impact_pos': [10.0, 4.0, 4.0, 1.0, 3.0, 0.5, 2.0],
+    'impact_neg': [-2.0, -1.0, -1.0, -0.5, -0.5, -0.5, -1.0],
+})
+
+
+@pytest.mark.parametrize(
+    ('df', 'expected'),
+    [
+        (SEPARATE_DF, ([10.0, 4.0, 4.0, 1.0, 3.0, 0.12, 1.5], [-2.0, -1.0, -1.0, -0.5, -0.5, -0.12, -0.75]))
+    ]
+)
+def test_separate_multiple_parent_success(df, expected):
+    result = separate_multiple_parent(df.copy())
+    assert list(result['scaled_pos_impact']) == expected[0]
+    assert list(result['scaled_neg_impact']) == expected[1]
+
+
+@pytest.mark.parametrize(
+    ('df', 'expected'),
+    [
+        (SEPARATE_DF, ([10.0, 4.0, 4.0, 1.0, 3.0, 0.5, 2.0], [-2.0, -1.0, -1.0, -0.5, -0.5, -0.5, -1.0]))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_separate_multiple_parent_fail(df, expected):
+    result = separate_multiple_parent(df.copy())
+    assert list(result['scaled_pos_impact']) == expected[0]
+    assert list(result['scaled_neg_impact']) == expected[1]
+
+
+TRAV = {
+    'nodes': {
+        -1: {'amount': 1, 'cum': 2.0, 'ind': 2e-6},
+        3: {'amount': 1.0, 'cum': 2.0, 'cum_neg': -1.0, 'cum_pos': 3.0, 'ind': 0.5},
+        5: {'amount': 0.5, 'cum': 1.5, 'cum_neg': 0.0, 'cum_pos': 1.5, 'ind': 1.5},
+    },
+    'edges': {
+        'path_id': np.array([0, 1]),
+        'parent_path_id': np.array([-1, 0]),
+        'activity': np.array([3, 5]),
+        'depth': np.array([1, 2]),
+        'amount': np.array([1.0, 0.5]),
+        'exc_amount': np.array([1.0, 0.5]),
+        'impact': np.array([2.0, 1.5]),
+        'impact_neg': np.array([-1.0, 0.0]),
+        'impact_pos': np.array([3.0, 1.5]),
+    },
+    'activities': {3: 103, 5: 105},
+    'counter': 2,
+    'cache_hits': 0,
+    'cache_misses': 2,
+    'adjoint_lookups': 0,
+}
+
+
+@pytest.mark.parametrize(
+    ('trav', 'expected'),
+    [
+        (TRAV, TRAV)
+    ]
+)
+def test_traversal_arrays_success(trav, expected):
+    result = traversal_from_arrays(*traversal_to_arrays(trav))
+    assert result['nodes'] == expected['nodes']
+    assert result['activities'] == expected['activities']
+    assert result['counter'] == expected['counter']
+    for col, values in expected['edges'].items():
+        assert np.array_equal(result['edges'][col], values)
+
+
+@pytest.mark.parametrize(
+    ('trav', 'expected'),
+    [
+        (TRAV, {3: 103})
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_traversal_arrays_fail(trav, expected):
+    result = traversal_from_arrays(*traversal_to_arrays(trav))
+    assert result['activities'] == expected
+
+
 @pytest.mark.skip(reason="Cant be tested until database_explorer is ready!")
 @pytest.mark.parametrize(
     ('list_act', 'expected'),
@@ -1,8 +1,10 @@
 import bw2data as bd
 import bw2calc as bc
+import bw_processing as bwp
+import numpy as np
 # import bw2io as bi
 
-from ..conftest import restore_database_ecoinvent
+from ..conftest import restore_database_ecoinvent, restore_database_useeio
 
 
 def sample_1():
@@ -26,3 +28,39 @@ def sample_1():
     lca.lcia()
 
     return lca, act, methods_ef, methods_cc, eidb
+
+
+def sample_3():
+    """USEEIO database of the test fixture"""
+    restore_database_useeio()
+    act = bd.get_node(name="Cutlery and handtools; at manufacturer")
+    return bd.Database(act['database'])
+
+
+def sample_2():
+    """LCA of a hand-built supply chain: A (0) consumes 0.5 of B (1) and 2 of C (2), B consumes 1 of C.
+
+    A, B and C emit 1, 2 and 3 of one flow (10) with a factor of 1, for a score of 1 + 0.5 * 2 + 2.5 * 3 = 9.5.
+    """
+    dp = bwp.create_datapackage()
+    dp.add_persistent_vector(
+        matrix="technosphere_matrix",
+        indices_array=np.array([(0, 0), (1, 1), (2, 2), (1, 0), (2, 0), (2, 1)], dtype=bwp.INDICES_DTYPE),
+        data_array=np.array([1, 1, 1, 0.5, 2, 1.0]),
+        flip_array=np.array([False, False, False, True, True, True]),
+    )
+    dp.add_persistent_vector(
+        matrix="biosphere_matrix",
+        indices_array=np.array([(10, 0), (10, 1), (10, 2)], dtype=bwp.INDICES_DTYPE),
+        data_array=np.array([1, 2, 3.0]),
+    )
+    dp.add_persistent_vector(
+        matrix="characterization_matrix",
+        indices_array=np.array([(10, 10)], dtype=bwp.INDICES_DTYPE),
+        data_array=np.array([1.0]),
+    )
+    lca = bc.LCA({0: 1}, data_objs=[dp])
+    lca.lci()
+    lca.lcia()
+
+    return lca
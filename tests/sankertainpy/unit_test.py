@@ -1,11 +1,20 @@
+import bw2calc as bc
+import bw2data as bd
 import pytest
 
 from bw_visualization.sankertainpy.utils import (
     update_or_create_nodes,
     calculate_score,
     recursive_calculation_to_plotly,
+    matrix_calculation_to_plotly,
+    sample_unit_scores,
+    parallel_sample_unit_scores,
+    stack_samples,
+    SankeySession,
+    unit_node_score,
 )
 from bw_visualization.sankertainpy.sankertainpy import (
+    colormap_lut,
     cut_off_flows,
     add_emissions,
     calc_emissions,
@@ -14,13 +23,21 @@ from bw_visualization.sankertainpy.sankertainpy import (
     flip_negativ_values,
     adjust_data,
 )
+from bw_visualization.utils import activate_project, project_location
 
-from .utils import sample_1
+from .utils import sample_1, write_chain, delete_chain
 
 
 ACT, METHOD = sample_1()
 
 
+@pytest.fixture(scope="module")
+def chain():
+    """Activity and method of a small written supply chain, deleted after the tests of this module"""
+    yield write_chain()
+    delete_chain()
+
+
 @pytest.mark.parametrize(
     ('act', 'method', 'expected'),
     [
@@ -116,6 +133,301 @@ def test_recursive_calculation_to_plotly_fail(act, method, expected):
     assert result['nodes'] is None
 
 
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, None)
+    ]
+)
+def test_matrix_calculation_to_plotly_success(act, method, expected):
+    result = matrix_calculation_to_plotly(act, method, max_level=5)
+
+    assert len(result['targets']) == len(result['sources']) == len(result['scores'])
+    assert result['sources'] == list(range(1, len(result['nodes'])))
+    assert result['nodes'][0]['act'] == result['nodes'][1]['act']
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, None)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_matrix_calculation_to_plotly_fail(act, method, expected):
+    result = matrix_calculation_to_plotly(act, method, max_level=5)
+
+    assert len(result['targets']) != len(result['scores'])
+
+
+@pytest.mark.parametrize(
+    ('max_level', 'cutoff'),
+    [
+        (3, 0),
+        (2, 0.1),
+        (5, 0.2),
+    ]
+)
+def test_matrix_calculation_database_walk_success(chain, max_level, cutoff):
+    act, method = chain
+    result = matrix_calculation_to_plotly(act, method, max_level=max_level, cutoff=cutoff)
+    expected = recursive_calculation_to_plotly(act, method, max_level=max_level, cutoff=cutoff, mc=True,
+                                               vectorized_mc=False, mc_number=3)
+
+    assert expected['nodes'] == result['nodes']
+    assert expected['sources'] == result['sources']
+    assert expected['targets'] == result['targets']
+    assert expected['scores'] == pytest.approx(result['scores'])
+
+
+@pytest.mark.parametrize(
+    ('max_level', 'cutoff'),
+    [
+        (1, 0)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_matrix_calculation_database_walk_fail(chain, max_level, cutoff):
+    act, method = chain
+    result = matrix_calculation_to_plotly(act, method, max_level=max_level, cutoff=cutoff)
+    expected = recursive_calculation_to_plotly(act, method, max_level=max_level + 2, cutoff=cutoff, mc=True,
+                                               vectorized_mc=False, mc_number=3)
+
+    assert expected['sources'] == result['sources']
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 3)
+    ]
+)
+def test_matrix_calculation_max_nodes_success(act, method, expected):
+    with pytest.warns(UserWarning, match="node count"):
+        result = matrix_calculation_to_plotly(act, method, max_level=5, cutoff=0, max_nodes=expected)
+
+    assert len(result['scores']) == expected
+    assert len(result['nodes']) == expected + 1
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 3)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_matrix_calculation_max_nodes_fail(act, method, expected):
+    result = matrix_calculation_to_plotly(act, method, max_level=5, cutoff=0, max_nodes=expected)
+
+    assert len(result['scores']) > expected
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 3)
+    ]
+)
+def test_importance_first_success(act, method, expected):
+    with pytest.warns(UserWarning, match="node count"):
+        depth_first = matrix_calculation_to_plotly(act, method, max_level=5, cutoff=0, max_nodes=expected)
+        result = matrix_calculation_to_plotly(
+            act, method, max_level=5, cutoff=0, max_nodes=expected, importance_first=True
+        )
+
+    assert len(result['scores']) == expected
+    assert sum(map(abs, result['scores'])) >= sum(map(abs, depth_first['scores']))
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 3)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_importance_first_fail(act, method, expected):
+    full = matrix_calculation_to_plotly(act, method, max_level=5, cutoff=0)
+    result = matrix_calculation_to_plotly(act, method, max_level=5, cutoff=0, importance_first=True)
+
+    assert result['scores'] != full['scores']
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 2)
+    ]
+)
+def test_unit_node_score_success(act, method, expected):
+    lca = bc.LCA({act: 1}, method, use_distributions=True)
+    lca.lci()
+    lca.lcia()
+    subtree = {}
+    first, _ = unit_node_score(subtree, act, lca, 1, 5, 0)
+    result, _ = unit_node_score(subtree, act, lca, expected, 5, 0)
+
+    assert sorted(subtree) == ['samples', 'score']
+    assert result == pytest.approx([expected * sample for sample in first])
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 2)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_unit_node_score_fail(act, method, expected):
+    lca = bc.LCA({act: 1}, method, use_distributions=True)
+    lca.lci()
+    lca.lcia()
+    subtree = {}
+    first, _ = unit_node_score(subtree, act, lca, 1, 5, 0)
+    result, _ = unit_node_score(subtree, act, lca, expected, 5, 0)
+
+    assert result == first
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, None)
+    ]
+)
+def test_sankey_session_success(act, method, expected):
+    session = SankeySession(act, method)
+    deep = session.view(max_level=3, cutoff=1e-3)
+    result = session.view(max_level=1, cutoff=1e-2)
+    fresh = matrix_calculation_to_plotly(act, method, max_level=1, cutoff=1e-2)
+
+    assert len(deep['scores']) >= len(result['scores'])
+    assert result['sources'] == fresh['sources']
+    assert result['targets'] == fresh['targets']
+    assert result['scores'] == fresh['scores']
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, None)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_sankey_session_fail(act, method, expected):
+    session = SankeySession(act, method)
+    result = session.view(max_level=1, cutoff=1e-2)
+
+    assert result is None
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, (5, 1))
+    ]
+)
+def test_sample_unit_scores_success(act, method, expected):
+    result = sample_unit_scores({act.id: 1}, method, [act.id], 5)
+
+    assert result.shape == expected
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, (1, 5))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_sample_unit_scores_fail(act, method, expected):
+    result = sample_unit_scores({act.id: 1}, method, [act.id], 5)
+
+    assert result.shape == expected
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 42)
+    ]
+)
+def test_parallel_sample_unit_scores_success(act, method, expected):
+    result = parallel_sample_unit_scores({act.id: 1}, method, [act.id], 4, workers=2, seed=expected)
+    repeated = parallel_sample_unit_scores({act.id: 1}, method, [act.id], 4, workers=2, seed=expected)
+
+    assert result.shape == (4, 1)
+    assert (result == repeated).all()
+
+
+@pytest.mark.parametrize(
+    ('suffix', 'expected'),
+    [
+        ('', True)
+    ]
+)
+def test_activate_project_success(suffix, expected):
+    name, base_dir, base_logs_dir = project_location()
+    activate_project(name + suffix, base_dir, base_logs_dir)
+
+    assert bd.projects.current == name
+    assert (bd.projects.dir.parent == base_dir) == expected
+
+
+@pytest.mark.parametrize(
+    ('suffix', 'expected'),
+    [
+        ('-missing', True)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_activate_project_fail(suffix, expected):
+    name, base_dir, base_logs_dir = project_location()
+    activate_project(name + suffix, base_dir, base_logs_dir)
+
+    assert (name + suffix in bd.projects) == expected
+
+
+@pytest.mark.parametrize(
+    ('act', 'method', 'expected'),
+    [
+        (ACT, METHOD, 42)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_parallel_sample_unit_scores_fail(act, method, expected):
+    parallel_sample_unit_scores({act.id: 1}, method, [act.id], 4, workers=0, seed=expected)
+
+
+@pytest.mark.parametrize(
+    ('scores', 'expected'),
+    [
+        ([[1.0, 2.0, 3.0], 0.5], ([2.0, 0.5], [[1.0, 2.0, 3.0], [0.5, 0.5, 0.5]], [True, False]))
+    ]
+)
+def test_stack_samples_success(scores, expected):
+    result = stack_samples({'scores': scores})
+
+    assert result['scores'] == expected[0]
+    assert result['samples'].tolist() == expected[1]
+    assert result['mc_mask'].tolist() == expected[2]
+
+
+@pytest.mark.parametrize(
+    ('scores', 'expected'),
+    [
+        ([[1.0, 2.0, 3.0], 0.5], ([[1.0, 2.0, 3.0], 0.5], [True, True]))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_stack_samples_fail(scores, expected):
+    result = stack_samples({'scores': scores})
+
+    assert result['scores'] == expected[0]
+    assert result['mc_mask'].tolist() == expected[1]
+
+
 @pytest.mark.parametrize(
     ('act', 'method', 'expected'),
     [
@@ -242,6 +554,33 @@ def test_calc_emissions_fail(act, method, expected):
     assert result[1] is None
 
 
+@pytest.mark.parametrize(
+    ('scores', 'expected'),
+    [
+        ([3.0, 1.0], ([1, 2, 3], [0, 1, 1], [3.0, 1.0, 2.0]))
+    ]
+)
+def test_calc_emissions_balance_success(scores, expected):
+    data = {'sources': [1, 2], 'targets': [0, 1], 'scores': scores, 'nodes': {0: {}, 1: {}, 2: {}}}
+    result = calc_emissions(data, ['a', 'b', 'c'])
+
+    assert (result[0]['sources'], result[0]['targets'], result[0]['scores']) == expected
+
+
+@pytest.mark.parametrize(
+    ('scores', 'expected'),
+    [
+        ([3.0, 1.0], ([1, 2], [0, 1], [3.0, 1.0]))
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_calc_emissions_balance_fail(scores, expected):
+    data = {'sources': [1, 2], 'targets': [0, 1], 'scores': scores, 'nodes': {0: {}, 1: {}, 2: {}}}
+    result = calc_emissions(data, ['a', 'b', 'c'])
+
+    assert (result[0]['sources'], result[0]['targets'], result[0]['scores']) == expected
+
+
 @pytest.mark.parametrize(
     ('act', 'method', 'expected'),
     [
@@ -273,6 +612,32 @@ def test_calc_quantile_flows_fail(act, method, expected):
     assert result[1] is None
 
 
+@pytest.mark.parametrize(
+    ('name', 'values', 'expected'),
+    [
+        ('Blues', (0.0, 1.0), 2)
+    ]
+)
+def test_colormap_lut_success(name, values, expected):
+    result = colormap_lut(name, values, 0.6)
+
+    assert len(result) == expected
+    assert all(color.startswith('rgba(') and color.endswith(', 0.6)') for color in result)
+
+
+@pytest.mark.parametrize(
+    ('name', 'values', 'expected'),
+    [
+        ('Blues', (0.0, 1.0), 2)
+    ]
+)
+@pytest.mark.xfail(strict=True)
+def test_colormap_lut_fail(name, values, expected):
+    result = colormap_lut(name, values, 0.6)
+
+    assert result[0] == result[1]
+
+
 @pytest.mark.parametrize(
     ('act', 'method', 'expected'),
     [
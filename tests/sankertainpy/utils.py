@@ -9,3 +9,39 @@ def sample_1():
     act = bd.get_node(name="Cutlery and handtools; at manufacturer")
     method = bd.methods.random()
     return act, method
+
+
+def write_chain(database="sankey"):
+    """Write a small supply chain without uncertainty and its method, deleted by ``delete_chain``.
+
+    Activity ``a`` consumes 0.5 ``b`` and 2 ``c``, ``b`` consumes 1 ``c`` and 0.2 ``d``, ``c`` consumes 0.3 ``d``. Each
+    one emits CO2, ``d`` takes some up. Without uncertainty, Monte Carlo samples equal the static scores.
+    """
+    bd.Database(database + " biosphere").write({
+        (database + " biosphere", "co2"): {"name": "CO2", "type": "emission", "unit": "kg", "categories": ("air",)},
+    })
+    inputs = {"a": [("b", 0.5), ("c", 2)], "b": [("c", 1), ("d", 0.2)], "c": [("d", 0.3)], "d": []}
+    emissions = {"a": 1, "b": 2, "c": 3, "d": -0.5}
+    bd.Database(database).write({
+        (database, code): {
+            "name": f"activity {code}",
+            "unit": "kg",
+            "location": "GLO",
+            "exchanges": [
+                {"input": (database, code), "amount": 1, "type": "production"},
+                {"input": (database + " biosphere", "co2"), "amount": emissions[code], "type": "biosphere"},
+            ] + [{"input": (database, i), "amount": amount, "type": "technosphere"} for i, amount in exchanges],
+        }
+        for code, exchanges in inputs.items()
+    })
+    method = bd.Method((database, "gwp"))
+    method.register(unit="kg CO2-eq")
+    method.write([((database + " biosphere", "co2"), 1)])
+    return bd.get_node(database=database, code="a"), method.name
+
+
+def delete_chain(database="sankey"):
+    """Delete the databases and method written by ``write_chain``."""
+    bd.Method((database, "gwp")).deregister()
+    del bd.databases[database]
+    del bd.databases[database + " biosphere"]